@@ -0,0 +1,97 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from array import array
+from ncd_pr33_15.receiver import Receiver, GAIN_2X, SAMPLE_RATE_12_BIT, SAMPLE_RATE_16_BIT
+
+
+# Owns the 4-20mA receiver and round-robins its channels on a fixed plan.
+#
+# The receiver is configured once. After each channel switch the scheduler waits out the settle time before taking
+# a reading, so a continuous mode conversion from the previous channel is never handed out. Sensors look up the
+# latest value for their channel, and the per-channel count tells them whether it is a new one.
+class ReceiverScheduler:
+
+    # Conversion periods at 240 samples/sec for 12-bit and 15 samples/sec for 16-bit. A channel switch restarts the
+    # conversion, so a channel is settled one period plus a margin after it is selected.
+    CONVERSION_NS = {
+        SAMPLE_RATE_12_BIT: 4166667,
+        SAMPLE_RATE_16_BIT: 66666667,
+    }
+    SETTLE_MARGIN_NS = 500000
+
+    ADDRESS = 0x68
+
+    CH_1 = 0
+    CH_2 = 1
+    CH_3 = 2
+    CH_4 = 3
+
+    def __init__(self, i2c, sample_rate, plan=(CH_1, CH_2, CH_3, CH_4), address=ADDRESS):
+        self._receiver = self._create_receiver(i2c, sample_rate, address)
+        self._plan = tuple(plan)
+        self._settle_ns = ReceiverScheduler.CONVERSION_NS[sample_rate] + ReceiverScheduler.SETTLE_MARGIN_NS
+        self._slot = 0
+        self._t1 = None  # timestamp of the last channel switch
+        self._values = array('h', [0] * 4)
+        self._counts = array('L', [0] * 4)
+        self._receiver.channel = self._plan[0]
+
+    # How often tick needs calling to keep up with the conversions
+    @property
+    def period(self):
+        return self._settle_ns
+
+    def value(self, ch):
+        return self._values[ch]
+
+    def count(self, ch):
+        return self._counts[ch]
+
+    def tick(self, timestamp):
+        if self._t1 is None:
+            self._t1 = timestamp
+            return
+        if timestamp - self._t1 < self._settle_ns:
+            return
+
+        # Read the settled channel, then move on to the next one in the plan
+        ch = self._plan[self._slot]
+        self._values[ch] = self._receiver.raw_value()
+        self._counts[ch] += 1
+
+        self._slot += 1
+        if self._slot == len(self._plan):
+            self._slot = 0
+        if self._plan[self._slot] != ch:
+            self._receiver.channel = self._plan[self._slot]
+        self._t1 = timestamp
+
+    @staticmethod
+    def _create_receiver(i2c, sample_rate, address):
+        receiver = Receiver(i2c, address)
+        receiver.gain = GAIN_2X
+        receiver.sample_rate = sample_rate
+        receiver.continuous = True
+        return receiver
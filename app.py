@@ -0,0 +1,231 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import random
+import time
+import microcontroller
+
+from board import D2, D3
+
+from encoder import Encoder
+from valve import Valve
+from gauge import Gauge
+from nextion import CommandBuffer
+from controller import Controller
+from sensor import Sensor
+from filters import SGFilter
+from adc import ReceiverScheduler
+from journal import Journal
+from capture import Capture
+from telemetry import Telemetry
+from bus import I2CBus
+
+# from mock_sensor import Sensor as MockSensor
+
+REFRESH_FREQ = 1000000  # Overall system freq. (100th sec)
+I2C_FAST_MODE = False  # Run the I2C bus at 400kHz, within the encoders' and receivers' datasheet limits (untried)
+I2C_FREQUENCY = I2CBus.FAST_MODE if I2C_FAST_MODE else I2CBus.STANDARD_MODE
+DISPLAY_MAX_WRITE = 11  # Most bytes sent to the display per refresh, ~0.95ms of blocking at 115200 baud, inside one tick
+STATE_FREQ = 2000000000  # Check whether the state needs persisting to NVM freq. (2 secs)
+NVM_STATE_FORMAT = "fl"  # Volume and learned shutoff latency (ns), repeated for each station
+NVM_STATE_THRESHOLD = 0.01  # Only persist once a volume has moved by this much or reached zero, or a latency changed
+CAPTURE = False  # Stream the raw receiver codes over the usb_cdc data channel (enable it in boot.py)
+CAPTURE_FREQ = 100000000  # Send the buffered capture records freq. (10th sec)
+TELEMETRY = False  # Stream a telemetry frame per station over the usb_cdc data channel (not with CAPTURE)
+TELEMETRY_FREQ = 100000000  # Telemetry frame freq. (10th sec)
+
+# Every dispensing station: its name, encoder address, valve pin, gauge component ids (dial, volume, flow,
+# temperature) and the receiver address and channels of its flow and temperature sensors. A receiver has four
+# channels, so each one serves two stations.
+STATIONS = (
+    ("left", 0x78, D2, ("p0", "vol0", "flow0", "tmp0"), (ReceiverScheduler.ADDRESS, Sensor.CH_1, Sensor.CH_2)),
+    ("right", 0x70, D3, ("p1", "vol1", "flow1", "tmp1"), (ReceiverScheduler.ADDRESS, Sensor.CH_3, Sensor.CH_4)),
+)
+
+
+def load_controller_state(journal, n):
+    try:
+        state = journal.load()
+        print("state: {}".format(state))
+        if state is not None:
+            return state
+    except Exception as ex:
+        print("Unable to load controller state. {}.".format(ex))
+    return (0,) * n
+
+
+def save_controller_state(journal, state):
+    try:
+        journal.save(state)
+    except Exception as ex:
+        print("Unable to save controller state. {}.".format(ex))
+
+
+# Every sensor's flow and temperature filters. See filters.py for the other engines and each one's delay and cost.
+def create_flow_filter():
+    return SGFilter.centred(Sensor.FLOW_WINDOW)
+
+
+def create_temp_filter():
+    return SGFilter.centred(Sensor.TEMP_WINDOW)
+
+
+def create_capture():
+    import usb_cdc
+    if usb_cdc.data is None:
+        print("Unable to capture, the usb_cdc data channel is not enabled.")
+        return None
+    return Capture(usb_cdc.data, Sensor.SAMPLE_RATE)
+
+
+def create_telemetry():
+    import usb_cdc
+    if usb_cdc.data is None:
+        print("Unable to send telemetry, the usb_cdc data channel is not enabled.")
+        return None
+    if CAPTURE:
+        print("Unable to send telemetry, the usb_cdc data channel is in use by the capture.")
+        return None
+    return Telemetry(usb_cdc.data)
+
+
+# The dispenser hardware and controllers, independent of the runtime that drives them.
+#
+# tasks() lists every periodic job as (name, callback, period, priority, offset), and code.py runs them on the
+# deadline scheduler. The stations' bus traffic is staggered across each
+# period by the offsets, so the I2C and UART work of N stations never all lands on the same tick.
+class App:
+
+    def __init__(self, i2c, uart, stations=STATIONS):
+        self.bus = I2CBus(i2c)
+        self.encoders = []
+        self.valves = []
+        self.sensors = []
+        self.controllers = []
+        self._stations = []
+
+        # Initialise random
+        random.seed(time.monotonic_ns())
+
+        # Setup the rotary encoders, set to amber whilst we set-up
+        for name, enc_address, valve_pin, gauge_ids, sensor_channels in stations:
+            enc = Encoder(self.bus, enc_address)
+            enc.led_color(Encoder.LED_AMBER)
+            self.encoders.append(enc)
+
+        # Setup the gauges, sharing the one display
+        self.display = CommandBuffer(uart, max_write=DISPLAY_MAX_WRITE)
+
+        # Setup the 4-20mA receivers, each one reading just the channels in use
+        self.receivers = []
+        plans = {}
+        for name, enc_address, valve_pin, gauge_ids, (address, flow_ch, temp_ch) in stations:
+            plans.setdefault(address, []).extend((flow_ch, temp_ch))
+        adcs = {}
+        for address, plan in plans.items():
+            adcs[address] = ReceiverScheduler(self.bus, Sensor.SAMPLE_RATE, plan, address)
+            self.receivers.append(adcs[address])
+
+        # Setup the valves, sensors and controllers
+        self.capture = create_capture() if CAPTURE else None
+        for i, (name, enc_address, valve_pin, gauge_ids, sensor_channels) in enumerate(stations):
+            address, flow_ch, temp_ch = sensor_channels
+            valve = Valve(valve_pin)
+            self.valves.append(valve)
+            gauge = Gauge(self.display, *gauge_ids)
+            sensor = Sensor(adcs[address], flow_ch, temp_ch, self.capture, create_flow_filter(), create_temp_filter())
+            # sensor = MockSensor(10, 1, valve)
+            self.sensors.append(sensor)
+            ctlr = Controller(name, valve, sensor, self.encoders[i], gauge)
+            self.controllers.append(ctlr)
+            self._stations.append((name, ctlr, sensor, adcs[address], self.encoders[i], gauge))
+
+        self.telemetry = create_telemetry() if TELEMETRY else None
+
+        self._journal = Journal(microcontroller.nvm, NVM_STATE_FORMAT * len(stations), NVM_STATE_THRESHOLD)
+        state = load_controller_state(self._journal, len(NVM_STATE_FORMAT) * len(stations))
+        for i, ctlr in enumerate(self.controllers):
+            ctlr.volume = state[2 * i]
+            ctlr.shutoff_latency_ns = state[2 * i + 1]
+
+        # Set the encoder LEDs to green now we are ready. Set-up writes go straight out, so the amber shows whilst the
+        # journal is scanned; only from here on are the encoder writes queued for service().
+        for name, enc_address, valve_pin, gauge_ids, sensor_channels in stations:
+            self.bus.configure(enc_address, posted=True)
+        for enc in self.encoders:
+            enc.led_color(Encoder.LED_GREEN)
+
+    # Tasks due at the same time run in priority order: inputs first, then the controllers, then the outputs. The
+    # receivers, and the sensor ticks, encoder polls and gauge refreshes of each station, are offset by an equal share
+    # of their period.
+    def tasks(self):
+        tasks = []
+        for k, adc in enumerate(self.receivers):
+            tasks.append(("adc {}".format(k), adc.tick, adc.period, 0, adc.period * k // len(self.receivers)))
+        n = len(self._stations)
+        for i, (name, ctlr, sensor, adc, enc, gauge) in enumerate(self._stations):
+            tasks.append((name + " sensor", sensor.tick, adc.period, 1, adc.period * i // n))
+            tasks.append((name + " encoder", enc.tick, Encoder.REFRESH_FREQ, 2, Encoder.REFRESH_FREQ * i // n))
+            tasks.append((name + " controller", ctlr.tick, REFRESH_FREQ, 3, 0))
+            tasks.append((name + " gauge text", gauge.refresh_text, Gauge.MODE_VOL_TEMP_REFRESH_FREQ, 4,
+                          Gauge.MODE_VOL_TEMP_REFRESH_FREQ * i // n))
+            tasks.append((name + " gauge dial", gauge.refresh_dial, Gauge.DIAL_FLOW_REFRESH_FREQ, 4,
+                          Gauge.DIAL_FLOW_REFRESH_FREQ * i // n))
+        tasks.append(("display", self.display.flush, REFRESH_FREQ, 5, 0))
+        tasks.append(("i2c", self.bus.service, REFRESH_FREQ, 5, 0))
+        if self.capture is not None:
+            tasks.append(("capture", self.capture.flush, CAPTURE_FREQ, 5, 0))
+        if self.telemetry is not None:
+            tasks.append(("telemetry", self.send_telemetry, TELEMETRY_FREQ, 5, 0))
+        tasks.append(("state", self.save_state, STATE_FREQ, 6, 0))
+        return tasks
+
+    def send_telemetry(self, timestamp):
+        for station, ctlr in enumerate(self.controllers):
+            self.telemetry.frame(timestamp, station, ctlr)
+        self.telemetry.flush(timestamp)
+
+    # noinspection PyUnusedLocal
+    def save_state(self, timestamp):
+        state = []
+        for ctlr in self.controllers:
+            state.append(ctlr.volume)
+            state.append(ctlr.shutoff_latency_ns)
+        save_controller_state(self._journal, state)
+
+    # What each station's controller and peripherals have done, and the bus load they made
+    def report(self):
+        self.bus.report()
+        for name, ctlr, sensor, adc, enc, gauge in self._stations:
+            ctlr.report()
+            enc.report(name)
+            sensor.report(name)
+            gauge.report(name)
+
+    def close(self):
+        for valve in self.valves:
+            valve.close()
+        for enc in self.encoders:
+            enc.led_color(Encoder.LED_RED)
+        self.bus.flush()
@@ -0,0 +1,225 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import time
+from array import array
+
+
+# Stands in front of busio.I2C for every driver on the bus, with the same try_lock/unlock/writeto/readfrom_into/
+# writeto_then_readfrom interface.
+#
+# Reads, and writes to devices that have not been configured otherwise, go straight out. Writes to a device configured
+# with posted=True (e.g. LED and value registers) are queued in preallocated slots instead, and a later write to the
+# same register replaces one still queued. service() sends a few queued writes per call, oldest first. Everything
+# that goes straight out, such as a flow sample, is therefore never held up behind more than the few queued writes of
+# one service() call. Reads from a device send its queued writes first, so the device never appears to go back in
+# time.
+#
+# Every transaction is timed and counted per address, for utilisation reports.
+class I2CBus:
+
+    STANDARD_MODE = 100000
+    FAST_MODE = 400000
+
+    SLOTS = 16
+    SLOT_SIZE = 8  # longest write that can be queued, register address included
+    SERVICE_BUDGET = 2  # queued writes sent per service() call
+
+    def __init__(self, i2c, slots=SLOTS):
+        self._i2c = i2c
+        self._posted = {}  # address -> True if writes are queued
+
+        # Queued writes. A free slot has address -1, seq orders the writes.
+        self._slot_address = array('h', [-1] * slots)
+        self._slot_length = array('B', [0] * slots)
+        self._slot_seq = array('L', [0] * slots)
+        self._slot_data = [bytearray(I2CBus.SLOT_SIZE) for _ in range(slots)]
+        self._seq = 0
+        self.queued = 0
+
+        self._stats = {}  # address -> [transactions, bytes, busy us]
+        self.reset_stats()
+
+    def configure(self, address, posted=False):
+        self._posted[address] = posted
+
+    def reset_stats(self):
+        self._stats = {}
+        self._started = time.monotonic_ns()
+        self.merged = 0  # queued writes replaced by a later write to the same register
+        self.max_queued = 0
+
+    # The busio.I2C interface
+
+    def try_lock(self):
+        return self._i2c.try_lock()
+
+    def unlock(self):
+        self._i2c.unlock()
+
+    def scan(self):
+        return self._i2c.scan()
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        if end is None:
+            end = len(buffer)
+        if self._posted.get(address, False) and end - start <= I2CBus.SLOT_SIZE:
+            self._post(address, buffer, start, end)
+            return
+        self._send_queued(address)
+        t = time.monotonic_ns()
+        self._i2c.writeto(address, buffer, start=start, end=end)
+        self._count(address, end - start, t)
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None):
+        if end is None:
+            end = len(buffer)
+        self._send_queued(address)
+        t = time.monotonic_ns()
+        self._i2c.readfrom_into(address, buffer, start=start, end=end)
+        self._count(address, end - start, t)
+
+    def writeto_then_readfrom(self, address, buffer_out, buffer_in, *, out_start=0, out_end=None, in_start=0,
+                              in_end=None):
+        if out_end is None:
+            out_end = len(buffer_out)
+        if in_end is None:
+            in_end = len(buffer_in)
+        self._send_queued(address)
+        t = time.monotonic_ns()
+        self._i2c.writeto_then_readfrom(address, buffer_out, buffer_in, out_start=out_start, out_end=out_end,
+                                        in_start=in_start, in_end=in_end)
+        self._count(address, out_end - out_start + in_end - in_start, t)
+
+    # Queued writes
+
+    # Called by the scheduler to send the oldest queued writes
+    # noinspection PyUnusedLocal
+    def service(self, timestamp):
+        if not self.queued or not self._i2c.try_lock():
+            return
+        try:
+            for _ in range(I2CBus.SERVICE_BUDGET):
+                if not self.queued:
+                    break
+                self._send(self._next())
+        finally:
+            self._i2c.unlock()
+
+    # Send everything queued, e.g. before shutting down
+    def flush(self):
+        while not self._i2c.try_lock():
+            pass
+        try:
+            while self.queued:
+                self._send(self._next())
+        finally:
+            self._i2c.unlock()
+
+    def _post(self, address, buffer, start, end):
+        length = end - start
+        register = buffer[start]
+        free = -1
+        for i in range(len(self._slot_address)):
+            a = self._slot_address[i]
+            if a == address and self._slot_length[i] == length and self._slot_data[i][0] == register:
+                self._copy(i, buffer, start, length)
+                self.merged += 1
+                return
+            if a < 0 and free < 0:
+                free = i
+        if free < 0:
+            # Full, so send the oldest write now to make room (the caller holds the lock)
+            free = self._next()
+            self._send(free)
+        self._slot_address[free] = address
+        self._slot_length[free] = length
+        self._slot_seq[free] = self._seq
+        self._copy(free, buffer, start, length)
+        self._seq += 1
+        self.queued += 1
+        if self.queued > self.max_queued:
+            self.max_queued = self.queued
+
+    def _copy(self, i, buffer, start, length):
+        data = self._slot_data[i]
+        for k in range(length):
+            data[k] = buffer[start + k]
+
+    def _next(self):
+        best = -1
+        for i in range(len(self._slot_address)):
+            if self._slot_address[i] < 0:
+                continue
+            if best < 0 or self._slot_seq[i] < self._slot_seq[best]:
+                best = i
+        return best
+
+    def _send(self, i):
+        address = self._slot_address[i]
+        length = self._slot_length[i]
+        self._slot_address[i] = -1
+        self.queued -= 1
+        t = time.monotonic_ns()
+        self._i2c.writeto(address, self._slot_data[i], end=length)
+        self._count(address, length, t)
+
+    # Send the writes queued for one device, oldest first
+    def _send_queued(self, address):
+        while self.queued:
+            oldest = -1
+            for i in range(len(self._slot_address)):
+                if self._slot_address[i] == address and (oldest < 0 or self._slot_seq[i] < self._slot_seq[oldest]):
+                    oldest = i
+            if oldest < 0:
+                return
+            self._send(oldest)
+
+    def _count(self, address, nbytes, started):
+        stats = self._stats.get(address)
+        if stats is None:
+            stats = [0, 0, 0]
+            self._stats[address] = stats
+        stats[0] += 1
+        stats[1] += nbytes
+        stats[2] += (time.monotonic_ns() - started) // 1000
+
+    # Share of the time since the stats were reset that the bus was busy
+    @property
+    def utilisation(self):
+        elapsed = time.monotonic_ns() - self._started
+        if elapsed <= 0:
+            return 0.0
+        return sum(stats[2] for stats in self._stats.values()) * 1000 / elapsed
+
+    def transactions(self, address):
+        stats = self._stats.get(address)
+        return stats[0] if stats else 0
+
+    def report(self):
+        print("i2c: utilisation={:.1f}% queued max={} merged={}".format(
+            100 * self.utilisation, self.max_queued, self.merged))
+        for address in sorted(self._stats):
+            stats = self._stats[address]
+            print("i2c 0x{:02x}: transactions={} bytes={} busy={}us".format(address, stats[0], stats[1], stats[2]))
@@ -0,0 +1,79 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import struct
+
+
+# Streams raw receiver codes as fixed-size binary records, for replaying real traces on the desktop.
+#
+# A capture starts with a header (magic, version, receiver sample rate), followed by one record per conversion:
+# timestamp in us (uint32, wrapping every ~71 minutes), channel (uint8) and the raw code (int16), little-endian.
+# Records are packed in place into one preallocated buffer and sent in a single write when flushed or full.
+#
+# The stream is normally usb_cdc.data, the second USB serial channel, so the binary records never mix with the
+# console. Where the stream reports whether a host is connected, records are dropped until one is, and the header
+# is sent again to every new connection.
+class Capture:
+
+    MAGIC = b"GRNC"
+    VERSION = 1
+    HEADER = "<4sBB"
+    RECORD = "<IBh"
+    RECORD_SIZE = struct.calcsize(RECORD)
+    RECORDS = 64
+
+    def __init__(self, stream, sample_rate, records=RECORDS):
+        self._stream = stream
+        self._header = struct.pack(Capture.HEADER, Capture.MAGIC, Capture.VERSION, sample_rate)
+        self._header_due = True
+        self._buf = bytearray(Capture.RECORD_SIZE * records)
+        self._view = memoryview(self._buf)
+        self._n = 0
+        self.records = 0
+        self.dropped = 0
+
+    def record(self, timestamp, ch, code):
+        if self._n == len(self._buf):
+            self._write()
+        struct.pack_into(Capture.RECORD, self._buf, self._n, (timestamp // 1000) & 0xFFFFFFFF, ch, code)
+        self._n += Capture.RECORD_SIZE
+        self.records += 1
+
+    # noinspection PyUnusedLocal
+    def flush(self, timestamp):
+        self._write()
+
+    def _write(self):
+        if not self._n:
+            return
+        if not getattr(self._stream, "connected", True):
+            self.dropped += self._n // Capture.RECORD_SIZE
+            self._header_due = True
+            self._n = 0
+            return
+        if self._header_due:
+            self._stream.write(self._header)
+            self._header_due = False
+        self._stream.write(self._view[:self._n])
+        self._n = 0
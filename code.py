@@ -22,108 +22,75 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import gc
+import sys
 import time
-import random
-import microcontroller
-import struct
+import supervisor
 
-from board import SCL, SDA, TX, RX, D2, D3
+from board import SCL, SDA, TX, RX
 from busio import I2C, UART
 
-from encoder import Encoder
-from valve import Valve
-from gauge import Gauge
-from controller import Controller
-from sensor import Sensor
-
-# from mock_sensor import Sensor
-
-REFRESH_FREQ = 1000000  # Overall system freq. (100th sec)
-STATE_FREQ = 2000000000  # Persist state to NVM freq. (2 secs)
-NVM_STATE_FORMAT = "ff"  # Left and right volume
-NVM_STATE_LENGTH = struct.calcsize(NVM_STATE_FORMAT)
-
-
-def load_controller_state():
+from app import App, I2C_FREQUENCY
+from scheduler import Scheduler
+from gcmon import GCMonitor
+from stats import LatencyStats
+
+REPORT_FREQ = 60000000000  # Report scheduler deadlines and jitter freq. (60 secs)
+GC_IDLE = True  # Only collect garbage in idle time between tasks, never part way through one
+GC_SLACK_NS = 500000  # Minimum idle time worth starting a collection in
+# Time every task and controller stage into latency histograms, dumped by sending "s" over USB serial. Off by default:
+# the timing reads monotonic_ns() around each stage, and every reading and difference is a heap allocated long int.
+STATS = False
+CONSOLE_FREQ = 100000000  # Poll the USB serial console for commands freq. (10th sec)
+
+
+def report(scheduler, monitor, app):
+    scheduler.report()
+    monitor.report()
+    app.report()
+
+
+# Serial console commands: "s" dumps the latency stats, "r" resets them
+def console(stats):
+    # noinspection PyUnusedLocal
+    def poll(timestamp):
+        while supervisor.runtime.serial_bytes_available:
+            command = sys.stdin.read(1)
+            if command == "s":
+                stats.report()
+            elif command == "r":
+                stats.reset()
+    return poll
+
+
+app = None
+with I2C(SCL, SDA, frequency=I2C_FREQUENCY) as i2c, UART(TX, RX, baudrate=115200) as uart:
     try:
-        state = struct.unpack(NVM_STATE_FORMAT, microcontroller.nvm[0:NVM_STATE_LENGTH])
-        print("state: {}".format(state))
-        return state
-    except Exception as ex:
-        print("Unable to load controller state. {}.".format(ex))
-        return 0, 0
-
-
-def save_controller_state(state):
-    try:
-        microcontroller.nvm[0:NVM_STATE_LENGTH] = struct.pack(NVM_STATE_FORMAT, state[0], state[1])
-    except Exception as ex:
-        print("Unable to save controller state. {}.".format(ex))
-
-
-with I2C(SCL, SDA, frequency=100000) as i2c, UART(TX, RX, baudrate=115200) as uart:
-    try:
-        # Initialise random
-        random.seed(time.monotonic_ns())
-
-        # Setup the rotary encoders
-        enc_left = Encoder(i2c, 0x78)
-        enc_right = Encoder(i2c, 0x70)
-
-        # Set the encoder LEDs to amber whilst we set-up
-        enc_left.led_color(Encoder.LED_AMBER)
-        enc_right.led_color(Encoder.LED_AMBER)
-
-        # Setup the valves
-        valve_left = Valve(D2)
-        valve_right = Valve(D3)
-
-        # Setup the gauges
-        gauge_left = Gauge(uart, "p0", "vol0", "flow0", "tmp0")
-        gauge_right = Gauge(uart, "p1", "vol1", "flow1", "tmp1")
-
-        # Setup the sensors
-        sensor_left = Sensor(i2c, Sensor.CH_1, Sensor.CH_2)
-        sensor_right = Sensor(i2c, Sensor.CH_3, Sensor.CH_4)
-
-        # Tick the sensors to fill the buffers
-        sensor_left.tick(time.monotonic_ns())
-        sensor_right.tick(time.monotonic_ns())
-
-        # sensor_left = MockSensor(10, 1, valve_left)
-        # sensor_right = MockSensor(10, 1, valve_right)
-
-        # Setup the controllers
-        ctlr_left = Controller("left", valve_left, sensor_left, enc_left, gauge_left)
-        ctlr_right = Controller("right", valve_right, sensor_right, enc_right, gauge_right)
-
-        volumes = load_controller_state()
-        ctlr_left.volume = volumes[0]
-        ctlr_right.volume = volumes[1]
-
-        # Set the encoder LEDs to green now we are ready
-        enc_left.led_color(Encoder.LED_GREEN)
-        enc_right.led_color(Encoder.LED_GREEN)
-
-        # Main loop - ticks the controllers at the configured frequency
-        refresh_timestamp = time.monotonic_ns()
-        state_timestamp = time.monotonic_ns()
-        while True:
-            if time.monotonic_ns() - refresh_timestamp > REFRESH_FREQ:
-                refresh_timestamp = time.monotonic_ns()
-                ctlr_left.tick(refresh_timestamp)
-                ctlr_right.tick(refresh_timestamp)
-            if time.monotonic_ns() - state_timestamp > STATE_FREQ:
-                state_timestamp = time.monotonic_ns()
-                save_controller_state((ctlr_left.volume, ctlr_right.volume))
+        app = App(i2c, uart)
+
+        # Main loop - every device, controller and the NVM persistence is a periodic task on the scheduler. Each task
+        # is measured for heap allocation, and with GC_IDLE automatic collection is off and the monitor collects in
+        # the scheduler's idle time once free memory runs low. (If the heap does run out, a collection still happens.)
+        monitor = GCMonitor()
+        scheduler = Scheduler(monitor.idle if GC_IDLE else None, GC_SLACK_NS)
+        if GC_IDLE:
+            gc.collect()
+            gc.disable()
+        start = time.monotonic_ns()
+        stats = LatencyStats()
+        if STATS:
+            for ctlr in app.controllers:
+                ctlr.measure_stages(stats)
+        for name, callback, period, priority, offset in app.tasks():
+            if STATS:
+                callback = stats.measure(name, callback)
+            scheduler.add(name, monitor.measure(callback), period, priority, start + offset)
+        scheduler.add("report", lambda timestamp: report(scheduler, monitor, app), REPORT_FREQ, 7,
+                      start + REPORT_FREQ)
+        if STATS:
+            scheduler.add("console", console(stats), CONSOLE_FREQ, 7, start)
+        scheduler.run()
 
     finally:
-        if valve_left:
-            valve_left.close()
-        if valve_right:
-            valve_right.close()
-        if enc_left:
-            enc_left.led_color(Encoder.LED_RED)
-        if enc_right:
-            enc_right.led_color(Encoder.LED_RED)
-
+        if app:
+            app.close()
@@ -22,14 +22,25 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import time
+
 from encoder import Encoder
+from integrator import VolumeIntegrator
+from shutoff import ShutoffPredictor
 
 
 class Controller:
 
-    def __init__(self, name, valve, sensor, encoder, gauge):
+    # Events latched between telemetry frames
+    EVENT_VOLUME = 0x01  # the volume was dialled in on the encoder
+    EVENT_BUTTON = 0x02
+    EVENT_START = 0x04  # the valve was opened
+    EVENT_STOP = 0x08  # the valve was closed
+    EVENT_DONE = 0x10  # the configured volume has been dispensed
+    EVENT_RESET = 0x20
+    EVENT_SETTLED = 0x40  # the flow has stopped after a dispense and its overshoot was measured
 
-        self._prev_timestamp = 0
+    def __init__(self, name, valve, sensor, encoder, gauge):
 
         self._name = name
         self._valve = valve
@@ -40,8 +51,6 @@ class Controller:
         self._open = False
         self._temp = 0
         self._flow = 0
-        self._prev_flow = 0
-        self._vol = 0
 
         self._enc_button = False
         self._enc_dblclick = False
@@ -49,16 +58,31 @@ class Controller:
         self._enc_val = 0
 
         self._calibration = 1
+        self._integrator = VolumeIntegrator()
+        self._events = 0
+        self._stages = None  # (stats, read, update, write) when the stages of each tick are being timed
+
+        # The valve is closed ahead of the volume by the predicted run-on, then the volume is integrated on past the
+        # close until the flow stops, to measure the overshoot the predictor learns from
+        self._shutoff = ShutoffPredictor()
+        self._settling = False
+        self._close_flow_ul = 0  # flow when the valve was closed
+
+        # Conversions cached between ticks, so a steady-state tick does no float arithmetic
+        self._flow_in = 0.0  # the flow that _flow_ul was converted from
+        self._flow_ul = 0
+        self._slope_in = 0.0  # the flow slope that _slope_ul was converted from
+        self._slope_ul = 0
+        self._vol_ul = 0  # the volume that _vol_out was converted from
+        self._vol_out = 0.0
 
     def reset(self):
 
-        print("{}: reset".format(self._name))
-
         self._open = False
         self._temp = 0
         self._flow = 0
-        self._prev_flow = 0
-        self._vol = 0
+        self._integrator.reset()
+        self._settling = False
 
         self._enc_button = False
         self._enc_dblclick = False
@@ -69,35 +93,87 @@ class Controller:
         self._encoder.reset()
         self._gauge.reset()
         self._sensor.reset()
+        self._events |= Controller.EVENT_RESET
 
     @property
     def name(self):
         return self._name
 
+    @property
+    def is_open(self):
+        return self._open
+
+    @property
+    def flow(self):
+        return self._flow
+
+    @property
+    def temperature(self):
+        return self._temp
+
+    @property
+    def raw_flow(self):
+        return self._sensor.raw_flow
+
+    @property
+    def microlitres(self):
+        return self._integrator.microlitres
+
+    @property
+    def overshoot(self):
+        return self._shutoff.overshoot
+
+    # The latency the shutoff has learned, to persist across restarts
+    @property
+    def shutoff_latency_ns(self):
+        return self._shutoff.latency_ns
+
+    @shutoff_latency_ns.setter
+    def shutoff_latency_ns(self, latency_ns):
+        self._shutoff.latency_ns = latency_ns
+
+    @property
+    def events(self):
+        result = self._events
+        self._events = 0
+        return result
+
     @property
     def volume(self):
-        return self._vol
+        return self._integrator.volume if self._integrator.microlitres > 0 else 0.0
 
     @volume.setter
     def volume(self, vol):
-        self._vol = vol
+        self._integrator.volume = vol
         self._enc_val = vol
 
-    def tick(self, timestamp):
-
-        # Input ticks
-        self._encoder.tick(timestamp)
+    # Time the read, update and write stages of every tick into LatencyStats stages of their own
+    def measure_stages(self, stats):
+        self._stages = (stats, stats.add(self._name + " read"), stats.add(self._name + " update"),
+                        stats.add(self._name + " write"))
 
-        # Operation
+    # The encoder, sensor and gauge are ticked by the scheduler as tasks of their own
+    def tick(self, timestamp):
+        if self._stages is None:
+            self._read_state()
+            self._update_state(timestamp)
+            self._write_state()
+            return
+
+        stats, read, update, write = self._stages
+        t0 = time.monotonic_ns()
         self._read_state()
+        t1 = time.monotonic_ns()
         self._update_state(timestamp)
+        t2 = time.monotonic_ns()
         self._write_state()
+        t3 = time.monotonic_ns()
+        stats.record(read, t1 - t0)
+        stats.record(update, t2 - t1)
+        stats.record(write, t3 - t2)
 
-        # Output ticks
-        self._gauge.tick(timestamp)
-        self._sensor.tick(timestamp)
-
-        self._prev_timestamp = timestamp
+    def report(self):
+        self._shutoff.report(self._name)
 
     def _read_state(self):
 
@@ -106,7 +182,6 @@ class Controller:
 
         # Read the sensor values
         self._temp = self._sensor.temperature
-        self._prev_flow = self._flow
         self._flow = self._sensor.flow_rate
 
         # Read the encoder state
@@ -117,31 +192,49 @@ class Controller:
 
     def _update_state(self, timestamp):
 
-        # If there was a manual change to via the encoder, use the new value; Otherwise calculate the new volume.
+        # Calculate the new volume; If there was a manual change to via the encoder, use the new value instead.
+        if self._flow != self._flow_in:
+            self._flow_in = self._flow
+            self._flow_ul = VolumeIntegrator.flow_ul(self._flow, self._calibration)
+        self._integrator.update(timestamp, self._flow_ul)
         if self._enc_change:
-            self._vol = self._enc_val
-            print("{}: vol={}".format(self._name, self._enc_val))
-        else:
-            period = (timestamp - self._prev_timestamp) * pow(10, -9)  # NOTE: flow is in litre/min, work in secs
-            flow = (self._flow + self._prev_flow)/120
-            delta = flow * period * self._calibration
-            self._vol -= delta
+            self._integrator.volume = self._enc_val
+            self._settling = False
+            self._events |= Controller.EVENT_VOLUME
 
         # If the button was pushed toggle the valve
         if self._enc_button:
             self._open = not self._open
-            if self._open:
-                print("{}: start".format(self._name, self._open))
-            print("{}: open={}".format(self._name, self._open))
+            self._settling = False
+            self._events |= Controller.EVENT_BUTTON | (Controller.EVENT_START if self._open else Controller.EVENT_STOP)
 
-        # If we have dispensed the configured volume, shut the valve
-        if self._vol <= 0:
-            self._vol = 0
-            self._enc_val = 0
-            if self._open:
+        # If what is left of the configured volume will run on through the valve as it closes, shut it now
+        if self._open:
+            slope = self._sensor.flow_slope
+            if slope != self._slope_in:
+                self._slope_in = slope
+                self._slope_ul = VolumeIntegrator.flow_ul(slope, self._calibration)
+            if self._integrator.microlitres <= self._shutoff.remaining(self._flow_ul, self._slope_ul):
                 self._open = False
-                print("{}: stop".format(self._name, self._open))
-                print("{}: open={}".format(self._name, self._open))
+                self._settling = self._flow_ul > 0
+                self._close_flow_ul = self._flow_ul
+                self._events |= Controller.EVENT_DONE | Controller.EVENT_STOP
+
+        # Once the flow has stopped, whatever was measured past the volume is the overshoot
+        elif self._settling:
+            if self._flow == 0:
+                self._shutoff.learn(-self._integrator.microlitres, self._close_flow_ul)
+                self._settling = False
+                self._events |= Controller.EVENT_SETTLED
+
+                # Whatever a short pour left behind is dropped with the overshoot, so the next press does not reopen
+                # the valve for a remainder the encoder and gauge already show as zero
+                self._integrator.volume = 0
+                self._enc_val = 0
+
+        if not self._settling and self._integrator.microlitres <= 0:
+            self._integrator.volume = 0
+            self._enc_val = 0
 
         # If the encoder was double-clicked reset everything
         if self._enc_dblclick:
@@ -157,10 +250,13 @@ class Controller:
             self._valve.close()
             self._encoder.led_color(Encoder.LED_GREEN)
 
-        # Write the encoder state
-        self._encoder.value = self._vol
+        # Write the encoder state, converting the volume to litres for display
+        if self._integrator.microlitres != self._vol_ul:
+            self._vol_ul = self._integrator.microlitres
+            self._vol_out = self._integrator.volume if self._vol_ul > 0 else 0.0
+        self._encoder.value = self._vol_out
 
         # Write the gauge state
-        self._gauge.vol = self._vol
+        self._gauge.vol = self._vol_out
         self._gauge.flow = self._flow
         self._gauge.temp = self._temp
@@ -31,12 +31,22 @@ class Encoder:
     REFRESH_FREQ = 100000000
     MIN_VALUE = 0
     MAX_VALUE = 80
+    STEP = 0.25
 
     LED_RED = 1
     LED_GREEN = 2
     LED_BLUE = 3
     LED_AMBER = 4
 
+    # RLED, GLED and BLED are consecutive registers, so a colour is one burst write starting at RLED
+    REG_RLED = 0x18
+    LED_RGB = {
+        LED_RED: (0x25, 0x00, 0x00),
+        LED_GREEN: (0x00, 0x25, 0x00),
+        LED_BLUE: (0x00, 0x00, 0x25),
+        LED_AMBER: (0x25, 0x15, 0x00),
+    }
+
     @staticmethod
     def _build_i2c_encoder(i2c, address):
         enc = I2CEncoder(i2c, address)
@@ -49,7 +59,7 @@ class Encoder:
         enc.cmin_float = Encoder.MIN_VALUE  # Set the min, max and step for encoder 0
         enc.cmax_float = Encoder.MAX_VALUE
         enc.cval_float = 0  # Initial value
-        enc.istep_float = 0.25  # Encoder step size
+        enc.istep_float = Encoder.STEP  # Encoder step size
         enc.rled = 0x00  # Turn the LEDs black
         enc.gled = 0x00
         enc.bled = 0x00
@@ -59,8 +69,15 @@ class Encoder:
 
     def __init__(self, i2c, address):
         self.enc = self._build_i2c_encoder(i2c, address)
-        self._t1 = 0  # timer used for state refresh
+        self._i2c = i2c
+        self._address = address
+        self._led = None  # colour currently shown, None if unknown
+        self._led_buf = bytearray(4)
+        self._led_buf[0] = Encoder.REG_RLED
+        self._led_writes = 0
+        self._led_writes_elided = 0
         self._value = 0
+        self._device_value = 0  # the (quantised) value last written to or read from the encoder
         self._value_refresh = True
         self._dblclick = False
         self._button = False
@@ -69,8 +86,8 @@ class Encoder:
         self._change = False
 
     def reset(self):
-        self._t1 = 0  # timer used for state refresh
         self._value = 0
+        self._device_value = 0  # the (quantised) value last written to or read from the encoder
         self._value_refresh = True
         self._button = False
         self._dblclick = False
@@ -85,13 +102,20 @@ class Encoder:
 
     @value.setter
     def value(self, value):
+        if value == self._value:
+            return
         if value < Encoder.MIN_VALUE:
             self._value = Encoder.MIN_VALUE
         elif value > Encoder.MAX_VALUE:
             self._value = Encoder.MAX_VALUE
         else:
             self._value = value
-        self._value_refresh = True
+
+        # Only write back when the value the encoder can show actually changes
+        value = int(self._value / Encoder.STEP + 0.5) * Encoder.STEP
+        if value != self._device_value:
+            self._device_value = value
+            self._value_refresh = True
 
     @property
     def dblclick(self):
@@ -111,50 +135,60 @@ class Encoder:
         self._change = False
         return result
 
-    def led_color(self, color):
-        if self.LED_AMBER == color:
-            self.enc.rled = 0x25  # Turn the LEDs green
-            self.enc.gled = 0x15
-            self.enc.bled = 0x00
-        elif self.LED_GREEN == color:
-            self.enc.rled = 0x00  # Turn the LEDs green
-            self.enc.gled = 0x25
-            self.enc.bled = 0x00
-        elif self.LED_RED == color:
-            self.enc.rled = 0x25  # Turn the LEDs red
-            self.enc.gled = 0x00
-            self.enc.bled = 0x00
-        else:
-            self.enc.rled = 0x00  # Turn the LEDs blue
-            self.enc.gled = 0x00
-            self.enc.bled = 0x25
+    @property
+    def led_writes(self):
+        return self._led_writes
+
+    @property
+    def led_writes_elided(self):
+        return self._led_writes_elided
 
+    def report(self, name):
+        print("{} encoder: led writes={} elided={}".format(name, self._led_writes, self._led_writes_elided))
 
+    def led_color(self, color):
+        if color == self._led:
+            self._led_writes_elided += 1
+            return
+        rgb = Encoder.LED_RGB.get(color, Encoder.LED_RGB[Encoder.LED_BLUE])
+        self._led_buf[1] = rgb[0]
+        self._led_buf[2] = rgb[1]
+        self._led_buf[3] = rgb[2]
+        while not self._i2c.try_lock():
+            pass
+        try:
+            self._i2c.writeto(self._address, self._led_buf)
+        finally:
+            self._i2c.unlock()
+        self._led = color
+        self._led_writes += 1
+
+    # Polled every REFRESH_FREQ by the scheduler
+    # noinspection PyUnusedLocal
     def tick(self, timestamp):
 
-        if timestamp - self._t1 > self.REFRESH_FREQ:
-            self._t1 = timestamp
-            status = self.enc.estatus
-            gp1 = self.enc.gp1
-
-            # Update the encoder value if required
-            if status & (1 << 3) or status & (1 << 4):
-                self._value = self.enc.cval_float
-                if not self._change:
-                    self._change = True
-            elif self._value_refresh:
-                self.enc.cval_float = self._value
-            self._value_refresh = False
-
-            # Update the double click flag
-            if status & (1 << 2) and not self._dblclick:
-                self._dblclick = True
-
-            # Update the button click latch
-            if gp1 == 0:
-                self._button_down = True
-                self._button |= self._button_up
-                self._button_up = False
-            else:
-                self._button_up = True
-                self._button_down = False
+        status = self.enc.estatus
+        gp1 = self.enc.gp1
+
+        # Update the encoder value if required
+        if status & (1 << 3) or status & (1 << 4):
+            self._value = self.enc.cval_float
+            self._device_value = self._value
+            if not self._change:
+                self._change = True
+        elif self._value_refresh:
+            self.enc.cval_float = self._device_value
+        self._value_refresh = False
+
+        # Update the double click flag
+        if status & (1 << 2) and not self._dblclick:
+            self._dblclick = True
+
+        # Update the button click latch
+        if gp1 == 0:
+            self._button_down = True
+            self._button |= self._button_up
+            self._button_up = False
+        else:
+            self._button_up = True
+            self._button_down = False
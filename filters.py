@@ -0,0 +1,232 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from array import array
+from ring import RingBuffer
+
+
+# A Savitzky-Golay filter that only evaluates a single output point of the window.
+#
+# The output point has nl samples to its left and nr samples to its right, so the window holds nl + nr + 1 samples
+# and the output is the value (or ld'th derivative) of the order m least-squares polynomial at index nl. The
+# convolution weights for that one point are computed once per (nl, nr, m, ld) and shared by every instance.
+class SGPointFilter:
+
+    _weights_cache = {}
+
+    def __init__(self, nl, nr, m=4, ld=0):
+        self.nl = nl
+        self.nr = nr
+        self.size = nl + nr + 1
+        self._weights = SGPointFilter.weights(nl, nr, m, ld)
+
+    # Apply the filter to a full RingBuffer of self.size samples
+    def apply(self, ring):
+        weights = self._weights
+        data = ring.data
+        j = ring.head
+        value = 0.0
+        for i in range(self.size):
+            value += weights[i] * data[j]
+            j += 1
+            if j == self.size:
+                j = 0
+        return value
+
+    @staticmethod
+    def weights(nl, nr, m=4, ld=0):
+        key = (nl, nr, m, ld)
+        weights = SGPointFilter._weights_cache.get(key)
+        if weights is None:
+            weights = SGPointFilter._solve(nl, nr, m, ld)
+            SGPointFilter._weights_cache[key] = weights
+        return weights
+
+    @staticmethod
+    def _solve(nl, nr, m, ld):
+        if ld > m or nl + nr < m:
+            raise ValueError("Invalid Savitzky-Golay filter nl={} nr={} m={} ld={}".format(nl, nr, m, ld))
+
+        # Work in x scaled to [-1, 1] so the normal equations stay well conditioned in single precision.
+        scale = max(nl, nr, 1)
+        xs = [(i - nl) / scale for i in range(nl + nr + 1)]
+
+        # Normal equations (A'A) z = e_ld, where A[i][k] = x_i^k
+        n = m + 1
+        a = [[0.0] * (n + 1) for _ in range(n)]
+        for j in range(n):
+            for k in range(n):
+                a[j][k] = sum(pow(x, j + k) for x in xs)
+            a[j][n] = 1.0 if j == ld else 0.0
+
+        # Gaussian elimination with partial pivoting
+        for col in range(n):
+            pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+            a[col], a[pivot] = a[pivot], a[col]
+            for row in range(col + 1, n):
+                f = a[row][col] / a[col][col]
+                for k in range(col, n + 1):
+                    a[row][k] -= f * a[col][k]
+        z = [0.0] * n
+        for row in range(n - 1, -1, -1):
+            z[row] = (a[row][n] - sum(a[row][k] * z[k] for k in range(row + 1, n))) / a[row][row]
+
+        # w_i = ld! * sum_k z_k x_i^k, rescaled back to unit sample spacing
+        factor = 1.0
+        for k in range(2, ld + 1):
+            factor *= k
+        factor /= pow(scale, ld)
+        weights = array('f', [0.0] * len(xs))
+        for i, x in enumerate(xs):
+            weights[i] = factor * sum(z[k] * pow(x, k) for k in range(n))
+        return weights
+
+
+# The filter engines a sensor channel can be given. Each one takes a raw code per sample with update() and returns the
+# filtered value. It declares its group delay, in samples, which is how far behind the newest sample its output is,
+# and its cost per sample, in multiply-adds or compares, so a channel's latency can be traded against its smoothing.
+
+# Savitzky-Golay over a window, output at the point with nl samples before it and nr after it. The delay is nr: a
+# centred window is the smoothest but the latest, the endpoint (nr=0) has no delay but passes more noise. With ld=1
+# the output is the derivative per sample. Until the window fills, the mean of the samples so far is given instead.
+class SGFilter:
+
+    def __init__(self, nl, nr, m=4, ld=0):
+        self._point = SGPointFilter(nl, nr, m, ld)
+        self._ring = RingBuffer(self._point.size, 'h')
+        self._ld = ld
+        self.delay = nr
+        self.cost = self._point.size
+
+    @staticmethod
+    def centred(half, m=4):
+        return SGFilter(half, half, m)
+
+    @staticmethod
+    def endpoint(window, m=2, ld=0):
+        return SGFilter(window - 1, 0, m, ld)
+
+    @property
+    def warm(self):
+        return self._ring.full
+
+    def reset(self):
+        self._ring.reset()
+
+    def update(self, value):
+        self._ring.push(value)
+        if self._ring.full:
+            return self._point.apply(self._ring)
+        return 0.0 if self._ld else self._ring.mean()
+
+
+# Exponential moving average, y += alpha * (x - y). The delay is (1 - alpha) / alpha samples.
+class EMAFilter:
+
+    def __init__(self, alpha=0.1):
+        self._alpha = alpha
+        self._value = None
+        self.delay = (1 - alpha) / alpha
+        self.cost = 1
+
+    @property
+    def warm(self):
+        return self._value is not None
+
+    def reset(self):
+        self._value = None
+
+    def update(self, value):
+        if self._value is None:
+            self._value = float(value)
+        else:
+            self._value += self._alpha * (value - self._value)
+        return self._value
+
+
+# Running median of an odd window, which rejects spikes of up to half the window outright rather than smearing them.
+# The window is also kept sorted, so each sample costs one pass to take the oldest out and one to put the newest in.
+class MedianFilter:
+
+    def __init__(self, window=5):
+        if window % 2 == 0:
+            raise ValueError("Median window must be odd, not {}".format(window))
+        self._ring = RingBuffer(window, 'h')
+        self._sorted = array('h', [0] * window)
+        self.delay = (window - 1) // 2
+        self.cost = window
+
+    @property
+    def warm(self):
+        return self._ring.full
+
+    def reset(self):
+        self._ring.reset()
+
+    def update(self, value):
+        ring = self._ring
+        ordered = self._sorted
+        n = len(ring)
+
+        # Take the oldest sample out of the sorted window
+        if ring.full:
+            oldest = ring.data[ring.head]
+            i = 0
+            while ordered[i] != oldest:
+                i += 1
+            n -= 1
+            while i < n:
+                ordered[i] = ordered[i + 1]
+                i += 1
+        ring.push(value)
+
+        # Insert the newest in order
+        i = n
+        while i > 0 and ordered[i - 1] > value:
+            ordered[i] = ordered[i - 1]
+            i -= 1
+        ordered[i] = value
+        n += 1
+
+        if n & 1:
+            return float(ordered[n >> 1])
+        return (ordered[(n >> 1) - 1] + ordered[n >> 1]) / 2
+
+
+# No filtering, each code is used as it is, like raw_sensor.py
+class PassThroughFilter:
+
+    def __init__(self):
+        self.delay = 0
+        self.cost = 0
+
+    @property
+    def warm(self):
+        return True
+
+    def reset(self):
+        return
+
+    def update(self, value):
+        return float(value)
@@ -22,7 +22,6 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import time
 import math
 
 
@@ -30,46 +29,37 @@ class Gauge:
 
     MODE_VOL_TEMP_REFRESH_FREQ = 100000000
     DIAL_FLOW_REFRESH_FREQ = 500000000
-    FLOAT_FORMAT = "{:05.2f}"
-    TEMP_FORMAT = "{:05.2f} C"
+    PANEL_SETTLE_NS = 10000000  # time the panel needs after each step of a dial refresh
+    FLOAT_WIDTH = 5
+    FLOAT_DECIMALS = 2
+    FLOAT_SCALE = 100  # 10 ** FLOAT_DECIMALS
+
+    # Changes smaller than these are not sent to the panel
+    VOL_DEADBAND = 0.0
+    FLOW_DEADBAND = 0.0
+    TEMP_DEADBAND = 0.05
+    TEXT_SUFFIX = b"\""
+    TEMP_SUFFIX = b" \xb0C\""
 
     COUNT_DOWN = 0
     COUNT_UP = 1
 
-    COLOR_RED = "RED"
-    COLOR_GREEN = "GREEN"
-
-    @staticmethod
-    def _write_cmd(uart, cmd, sleep=False):
-        data = bytearray(cmd.encode('iso-8859-1'))
-        data.append(0xFF)
-        data.append(0xFF)
-        data.append(0xFF)
-        uart.write(data)
-        if sleep:
-            time.sleep(0.01)
-
-    @staticmethod
-    def _write_text(uart, target, value, sleep=False):
-        Gauge._write_cmd(uart, "{}.txt=\"{}\"".format(target, value), sleep)
-
-    @staticmethod
-    def _write_fg_color(uart, target, color, sleep=False):
-        Gauge._write_cmd(uart, "{}.pco={}".format(target, color), sleep)
-
-    @staticmethod
-    def _write_dial(uart, target, value, sleep=False):
-        Gauge._write_cmd(uart, "{}.pic={}".format(target, value), sleep)
-
-    def __init__(self, uart, dial_id, vol_id, flow_id, temp_id):
-        self._uart = uart
-        self._dial_id = dial_id
-        self._vol_id = vol_id
-        self._flow_id = flow_id
-        self._temp_id = temp_id
-
-        Gauge._write_cmd(self._uart, "bkcmd=0")
-        Gauge._write_cmd(self._uart, "dim=100")
+    COLOR_RED = b"RED"
+    COLOR_GREEN = b"GREEN"
+
+    def __init__(self, display, dial_id, vol_id, flow_id, temp_id):
+        self._display = display
+
+        # Pre-encode the command prefixes so a refresh only renders the values
+        self._dial_pic = "{}.pic=".format(dial_id).encode('iso-8859-1')
+        self._vol_pco = "{}.pco=".format(vol_id).encode('iso-8859-1')
+        self._vol_txt = "{}.txt=\"".format(vol_id).encode('iso-8859-1')
+        self._flow_txt = "{}.txt=\"".format(flow_id).encode('iso-8859-1')
+        self._flow_ref = "ref {}".format(flow_id).encode('iso-8859-1')
+        self._temp_txt = "{}.txt=\"".format(temp_id).encode('iso-8859-1')
+
+        self._display.command(b"bkcmd=0")
+        self._display.command(b"dim=100")
 
         self._mode = Gauge.COUNT_UP
         self._dial = 0
@@ -83,8 +73,17 @@ class Gauge:
         self._temp_refresh = True
         self._flow_refresh = True
 
-        self._t1 = 0  # timestamp of last vol/temp refresh
-        self._t2 = 0  # timestamp of last dial/flow refresh
+        self._hold = 0  # no writes before this timestamp, whilst the panel finishes a dial refresh
+        self._flow_due = False
+
+        # The values the panel is currently showing, -1 if unknown
+        self._vol_shown = -1.0
+        self._temp_shown = -1.0
+        self._flow_shown = -1.0
+        self._color_shown = None
+
+        self._sent = 0
+        self._suppressed = 0
 
     def reset(self):
 
@@ -100,6 +99,22 @@ class Gauge:
         self._temp_refresh = True
         self._flow_refresh = True
 
+        self._vol_shown = -1.0
+        self._temp_shown = -1.0
+        self._flow_shown = -1.0
+        self._color_shown = None
+
+    @property
+    def sent(self):
+        return self._sent
+
+    @property
+    def suppressed(self):
+        return self._suppressed
+
+    def report(self, name):
+        print("{} gauge: updates sent={} suppressed={}".format(name, self._sent, self._suppressed))
+
     @property
     def mode(self):
         return self._mode
@@ -115,6 +130,8 @@ class Gauge:
 
     @vol.setter
     def vol(self, vol):
+        if vol == self._vol:
+            return
         if vol < 0:
             self._vol = 0.0
         else:
@@ -127,6 +144,8 @@ class Gauge:
 
     @temp.setter
     def temp(self, temp):
+        if temp == self._temp:
+            return
         if temp < 0:
             self._temp = 0.0
         else:
@@ -139,6 +158,8 @@ class Gauge:
 
     @flow.setter
     def flow(self, flow):
+        if flow == self._flow:
+            return
         if flow < 0:
             self._flow = 0.0
         else:
@@ -151,32 +172,76 @@ class Gauge:
             self._dial = dial
             self._dial_refresh = True
 
-    def tick(self, timestamp):
-
-        # if we've exceeded the mode/vol/temp refresh frequency, do a refresh
-        if timestamp - self._t1 > self.MODE_VOL_TEMP_REFRESH_FREQ:
-            self._t1 = timestamp
-            if self._vol_refresh:
-                flow_color = Gauge.COLOR_GREEN
-                if self._mode == Gauge.COUNT_DOWN:
-                    flow_color = Gauge.COLOR_RED
-                Gauge._write_fg_color(self._uart, self._vol_id, flow_color)
-                Gauge._write_text(self._uart, self._vol_id, self.FLOAT_FORMAT.format(self._vol))
-                self._vol_refresh = False
-            if self._temp_refresh:
-                Gauge._write_text(self._uart, self._temp_id, self.TEMP_FORMAT.format(self._temp))
-                self._temp_refresh = False    
-        
-        # if we've exceeded the dial/flow refresh frequency, do a refresh
-        if timestamp - self._t2 > self.DIAL_FLOW_REFRESH_FREQ:
-            self._t2 = timestamp
-            if self._dial_refresh:
-                # shenanigans required to prevent flicker, because the flow value overlaps the dial.
-                Gauge._write_cmd(self._uart, "ref_stop")
-                Gauge._write_dial(self._uart, self._dial_id, self._dial)
-                Gauge._write_cmd(self._uart, "ref {}".format(self._flow_id), True)
-                Gauge._write_cmd(self._uart, "ref_star", True)
-                self._dial_refresh = False
-            if self._flow_refresh:
-                Gauge._write_text(self._uart, self._flow_id, self.FLOAT_FORMAT.format(self._flow))
-                self._flow_refresh = False
+    # Called every MODE_VOL_TEMP_REFRESH_FREQ by the scheduler
+    def refresh_text(self, timestamp):
+
+        # Hold off whilst the panel is still working through a dial refresh
+        if timestamp < self._hold:
+            return
+
+        if self._vol_refresh:
+            flow_color = Gauge.COLOR_GREEN
+            if self._mode == Gauge.COUNT_DOWN:
+                flow_color = Gauge.COLOR_RED
+            if flow_color is not self._color_shown:
+                self._display.put(self._vol_pco)
+                self._display.command(flow_color)
+                self._color_shown = flow_color
+            if self._changed(self._vol, self._vol_shown, Gauge.VOL_DEADBAND):
+                self._write_float(self._vol_txt, self._vol, Gauge.TEXT_SUFFIX)
+                self._vol_shown = self._vol
+            self._vol_refresh = False
+        if self._temp_refresh:
+            if self._changed(self._temp, self._temp_shown, Gauge.TEMP_DEADBAND):
+                self._write_float(self._temp_txt, self._temp, Gauge.TEMP_SUFFIX)
+                self._temp_shown = self._temp
+            self._temp_refresh = False
+
+        # Catch up with a flow refresh that was held back by a dial refresh
+        if self._flow_due:
+            self._refresh_flow()
+
+    # Called every DIAL_FLOW_REFRESH_FREQ by the scheduler
+    def refresh_dial(self, timestamp):
+
+        if timestamp < self._hold:
+            return
+
+        self._flow_due = True
+        if self._dial_refresh:
+            # shenanigans required to prevent flicker, because the flow value overlaps the dial. The panel needs
+            # time after the ref and ref_star, so defer the ref_star and hold off the flow text until it is done.
+            self._display.command(b"ref_stop")
+            self._display.put(self._dial_pic)
+            self._display.put_int(self._dial)
+            self._display.end()
+            self._display.command(self._flow_ref)
+            self._display.defer(b"ref_star", timestamp + Gauge.PANEL_SETTLE_NS)
+            self._hold = timestamp + 2 * Gauge.PANEL_SETTLE_NS
+            self._dial_refresh = False
+            return
+
+        self._refresh_flow()
+
+    def _refresh_flow(self):
+        self._flow_due = False
+        if self._flow_refresh:
+            if self._changed(self._flow, self._flow_shown, Gauge.FLOW_DEADBAND):
+                self._write_float(self._flow_txt, self._flow, Gauge.TEXT_SUFFIX)
+                self._flow_shown = self._flow
+            self._flow_refresh = False
+
+    # Whether value would change what the panel shows by at least the deadband
+    def _changed(self, value, shown, deadband):
+        if shown >= 0 and (abs(value - shown) < deadband or
+                           int(value * Gauge.FLOAT_SCALE + 0.5) == int(shown * Gauge.FLOAT_SCALE + 0.5)):
+            self._suppressed += 1
+            return False
+        self._sent += 1
+        return True
+
+    def _write_float(self, prefix, value, suffix):
+        self._display.put(prefix)
+        self._display.put_fixed(value, Gauge.FLOAT_WIDTH, Gauge.FLOAT_DECIMALS)
+        self._display.put(suffix)
+        self._display.end()
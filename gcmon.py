@@ -0,0 +1,100 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import gc
+import time
+from array import array
+
+try:
+    from gc import mem_free
+except ImportError:
+    mem_free = None  # Not available on desktop CPython
+
+
+# Watches the heap around the steady-state ticks and collects garbage in idle time instead.
+#
+# measure() wraps a task callback and compares gc.mem_free() before and after each call: a drop is heap allocated by
+# the tick, a rise means a collection ran in the middle of it, and its timestamp is recorded. idle() is the scheduler's
+# idle hook and runs gc.collect() once free memory falls below the low water mark, timing each collection.
+class GCMonitor:
+
+    HISTORY = 32
+    LOW_WATER = 16384  # bytes
+
+    def __init__(self, low_water=LOW_WATER, history=HISTORY):
+        self._low_water = low_water
+        self.ticks = 0
+        self.allocating_ticks = 0
+        self.allocated = 0  # bytes, over all ticks
+        self.max_allocated = 0  # bytes, in one tick
+
+        # Timestamps (ms) of collections that landed inside a tick
+        self.tick_collections = 0
+        self._tick_collected_at = array('L', [0] * history)
+
+        # Durations (us) of the collections run in idle time
+        self.idle_collections = 0
+        self._idle_collect_us = array('L', [0] * history)
+
+    def measure(self, callback):
+        if mem_free is None:
+            return callback
+
+        def measured(timestamp):
+            before = mem_free()
+            callback(timestamp)
+            after = mem_free()
+            self.ticks += 1
+            if after > before:
+                self._tick_collected_at[self.tick_collections % len(self._tick_collected_at)] = \
+                    (timestamp // 1000000) & 0xFFFFFFFF
+                self.tick_collections += 1
+            elif after < before:
+                allocated = before - after
+                self.allocating_ticks += 1
+                self.allocated += allocated
+                if allocated > self.max_allocated:
+                    self.max_allocated = allocated
+
+        return measured
+
+    # noinspection PyUnusedLocal
+    def idle(self, timestamp, slack):
+        if mem_free is None or mem_free() >= self._low_water:
+            return
+        start = time.monotonic_ns()
+        gc.collect()
+        self._idle_collect_us[self.idle_collections % len(self._idle_collect_us)] = \
+            (time.monotonic_ns() - start) // 1000
+        self.idle_collections += 1
+
+    def report(self):
+        print("gc: ticks={} allocating={} allocated={}B max={}B".format(
+            self.ticks, self.allocating_ticks, self.allocated, self.max_allocated))
+        n = min(self.tick_collections, len(self._tick_collected_at))
+        print("gc: collections in ticks={} last at {}ms".format(
+            self.tick_collections, list(self._tick_collected_at[:n])))
+        n = min(self.idle_collections, len(self._idle_collect_us))
+        print("gc: collections in idle={} took {}us".format(
+            self.idle_collections, list(self._idle_collect_us[:n])))
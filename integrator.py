@@ -0,0 +1,95 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+from array import array
+
+
+# Integrates flow into dispensed volume in integer arithmetic.
+#
+# Volume is held in microlitres, flow in microlitres/sec and time in nanoseconds, so nothing is rounded away between
+# ticks: whole microlitres are taken off the volume and the fraction left over is carried in the accumulator. Flow is
+# integrated with the trapezoid rule between consecutive updates. Floats only appear at the boundaries, converting
+# the sensor's litres/min in and litres out for display.
+class VolumeIntegrator:
+
+    UL_PER_LITRE = 1000000
+    UL_PER_SEC_PER_LPM = 1000000 / 60
+    MAX_SMALL_NS = 1000000000  # longest gap between updates that is worked in small ints
+
+    def __init__(self):
+        self._vol = 0  # microlitres
+        self._prev_flow = 0  # microlitres/sec
+        self._prev_timestamp = None
+        self._ns = 0  # nanoseconds not yet integrated
+        self._acc = 0  # (microlitres/sec * microseconds) not yet taken off the volume
+        self._gap = array('l', [0])  # the last gap between updates, ns
+
+    def reset(self):
+        self._vol = 0
+        self._prev_flow = 0
+        self._ns = 0
+        self._acc = 0
+
+    @property
+    def volume(self):
+        return self._vol / VolumeIntegrator.UL_PER_LITRE
+
+    @volume.setter
+    def volume(self, litres):
+        self._vol = int(litres * VolumeIntegrator.UL_PER_LITRE + 0.5)
+        self._acc = 0
+
+    @property
+    def microlitres(self):
+        return self._vol
+
+    @staticmethod
+    def flow_ul(flow, calibration=1):
+        # litres/min to microlitres/sec
+        return int(flow * calibration * VolumeIntegrator.UL_PER_SEC_PER_LPM + 0.5)
+
+    def update(self, timestamp, flow_ul):
+        if self._prev_timestamp is not None:
+
+            # monotonic_ns() timestamps are long ints after a second of uptime, and so is every result worked from one.
+            # Passing the gap through an array('l') slot brings it back as a small int, so the timestamp subtraction is
+            # the only long int arithmetic in an update. A longer gap is worked as it is.
+            ns = timestamp - self._prev_timestamp
+            if 0 <= ns <= VolumeIntegrator.MAX_SMALL_NS:
+                self._gap[0] = ns
+                ns = self._gap[0]
+
+            # Work in whole microseconds, carrying the left over nanoseconds to the next update, so the product below
+            # stays a small int for a 1ms tick at full flow. Plain // rather than divmod, which allocates a tuple.
+            ns += self._ns
+            us = ns // 1000
+            self._ns = ns - us * 1000
+
+            # Trapezoid: delta = (f0 + f1) / 2 * dt, with dt in microseconds
+            acc = self._acc + (self._prev_flow + flow_ul) * us
+            whole = acc // 2000000
+            self._acc = acc - whole * 2000000
+            self._vol -= whole
+
+        self._prev_timestamp = timestamp
+        self._prev_flow = flow_ul
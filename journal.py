@@ -0,0 +1,130 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import struct
+
+
+def crc16(data, crc=0xFFFF):
+    # CRC-16/CCITT-FALSE
+    for b in data:
+        crc ^= b << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+    return crc
+
+
+# A log-structured journal of state records across an NVM region.
+#
+# Each record is a sequence number, the packed values and a CRC, written to the slot after the previous record and
+# wrapping at the end of the region, so writes are spread over the whole region rather than hammering one spot. A
+# record is only written when a value has moved by at least the threshold, or has reached zero from anything else so
+# that a finished pour is never restored as a sliver of volume. load() scans every slot once and returns
+# the values of the valid record with the highest sequence number.
+class Journal:
+
+    HEADER_FORMAT = "<I"
+    CRC_FORMAT = "<H"
+
+    def __init__(self, nvm, fmt, threshold=0.0, start=0, length=None):
+        self._nvm = nvm
+        self._fmt = "<" + fmt
+        self._threshold = threshold
+        self._start = start
+        self._payload = struct.calcsize(self._fmt)
+        self._header = struct.calcsize(Journal.HEADER_FORMAT)
+        self._size = self._header + self._payload + struct.calcsize(Journal.CRC_FORMAT)
+        if length is None:
+            length = len(nvm) - start
+        self._slots = length // self._size
+        if self._slots < 1:
+            raise ValueError("NVM region of {} bytes is too small for a {} byte record".format(length, self._size))
+
+        self._record = bytearray(self._size)
+        self._seq = 0
+        self._slot = 0
+        self._values = None  # the values in the newest record
+        self._writes = 0
+
+    @property
+    def slots(self):
+        return self._slots
+
+    @property
+    def record_size(self):
+        return self._size
+
+    @property
+    def writes(self):
+        return self._writes
+
+    def load(self):
+        newest = None
+        newest_seq = 0
+        for slot in range(self._slots):
+            offset = self._start + slot * self._size
+            record = self._nvm[offset:offset + self._size]
+            crc = struct.unpack_from(Journal.CRC_FORMAT, record, self._size - 2)[0]
+            if crc != crc16(record[:self._size - 2]):
+                continue
+            seq = struct.unpack_from(Journal.HEADER_FORMAT, record, 0)[0]
+            if newest is None or seq > newest_seq:
+                newest = slot
+                newest_seq = seq
+                self._values = struct.unpack_from(self._fmt, record, self._header)
+
+        if newest is None:
+            self._seq = 0
+            self._slot = 0
+            self._values = None
+        else:
+            self._seq = newest_seq
+            self._slot = (newest + 1) % self._slots
+        return self._values
+
+    def save(self, values):
+        if self._values is not None and not self._changed(values):
+            return False
+
+        self._seq += 1
+        struct.pack_into(Journal.HEADER_FORMAT, self._record, 0, self._seq)
+        struct.pack_into(self._fmt, self._record, self._header, *values)
+        struct.pack_into(Journal.CRC_FORMAT, self._record, self._size - 2, crc16(self._record[:self._size - 2]))
+
+        offset = self._start + self._slot * self._size
+        self._nvm[offset:offset + self._size] = self._record
+        self._slot = (self._slot + 1) % self._slots
+        self._values = tuple(values)
+        self._writes += 1
+        return True
+
+    def _changed(self, values):
+        for i in range(len(values)):
+            value = values[i]
+            saved = self._values[i]
+            if abs(value - saved) >= self._threshold or (value == 0 and saved != 0):
+                return True
+        return False
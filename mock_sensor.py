@@ -23,38 +23,69 @@
 # THE SOFTWARE.
 
 import math
-import random
-from sgfilter import SGFilter
+from array import array
+from filters import SGPointFilter
 
 
 # A mock water flow/temperature sensor.
+#
+# One period of the waveform and a block of normal deviates from a private seeded generator are computed once, already
+# passed through the SG filter, and shared by every mock with the same seed. A tick is then two table lookups. The
+# noise block has a prime length so that the waveform and the noise only line up again after ~1M samples.
 class Sensor:
 
     SAMPLE_SIZE = 1024
+    NOISE_SIZE = 997
     XMAX = 2.5
+    SEED = 1
+
+    FILTER_NL = 26
+    FILTER_NR = 24
+
+    TEMP = 10.5
+    TEMP_VARIANCE = 0.5
 
-    def __init__(self, flow_rate, variance, valve):
+    _wave_cache = None
+    _noise_cache = {}
+
+    def __init__(self, flow_rate, variance, valve, seed=SEED):
         self._flow_rate = flow_rate
         self._variance = variance
         self._valve = valve
+        self._wave = Sensor._wave_table()
+        self._noise = Sensor._noise_table(seed)
         self._tick = 0
+        self._noise_i = 0
         self._value = 0
-
-        # Setup the sensor filter
-        self._sensor_buf = []
-        self._sensor_filter = SGFilter(nr=25, nl=25)
-
+        self._temp = Sensor.TEMP
 
     def reset(self):
         self._tick = 0
+        self._noise_i = 0
         self._value = 0
 
     # noinspection PyUnusedLocal
     def tick(self, timestamp):
-        value = 0
-        while value == 0:
-            value = self._read_flow_rate()
-        self._value = value
+        value = self._flow_rate + self._wave[self._tick] + self._variance * self._noise[self._noise_i]
+        self._value = value if value > 0 else 0.0
+
+        # Take the temperature noise from the other half of the block
+        i = self._noise_i + Sensor.NOISE_SIZE // 2
+        if i >= Sensor.NOISE_SIZE:
+            i -= Sensor.NOISE_SIZE
+        self._temp = Sensor.TEMP + Sensor.TEMP_VARIANCE * self._noise[i]
+
+        self._tick += 1
+        if self._tick == Sensor.SAMPLE_SIZE:
+            self._tick = 0
+        self._noise_i += 1
+        if self._noise_i == Sensor.NOISE_SIZE:
+            self._noise_i = 0
+
+    # There is no receiver behind the mock
+    @property
+    def raw_flow(self):
+        return 0
 
     @property
     def flow_rate(self):
@@ -63,45 +94,65 @@ class Sensor:
         else:
             return 0.0
 
+    # The wave is the flow's only trend, and it is slow enough to leave out
+    @property
+    def flow_slope(self):
+        return 0.0
+
     @property
     def temperature(self):
-        return random.uniform(10, 11)
-
-    def _read_flow_rate(self):
-
-        # Fill the sample window
-        while len(self._sensor_buf) < 51:
-            self._sensor_buf.append(self._next_value())
-
-        # Add the current sensor flow rate to the buffer
-        self._sensor_buf.pop(0)
-        self._sensor_buf.append(self._next_value())
-
-        # Filter the values and return the midpoint value
-        f = self._sensor_filter.filter(self._sensor_buf)
-        return f[26] if f[26] > 0 else 0.0
-
-    def _next_value(self):
-        x1 = self.XMAX * self._tick / (self.SAMPLE_SIZE - 1)
-        x2 = self.XMAX * (self._tick + 1) / (self.SAMPLE_SIZE - 1)
-        u = random.random()
-        v = random.random()
-
-        if u > 0.0:  # Apply the Box--Muller algorithm on |u| and |v|
-            f = math.sqrt(-2 * math.log(u))
-            z = (math.pi * 2) * v
-            u = f * math.cos(z)  # Normally distributed with E(|u|)=0 and Var(|u|)=1
-            v = f * math.sin(z)  # Normally distributed with E(|u|)=0 and Var(|u|)=1
-            r1 = Sensor._func(x1) + self._variance * u  # $f(x_1)$
-            r2 = Sensor._func(x2) + self._variance * v  # $f(x_2)$
-            value = self._flow_rate + random.choice([r1, r2])
-        else:
-            value = 0
+        return self._temp
 
-        if self._tick > 1024:
-            self._tick = 0
+    @staticmethod
+    def _wave_table():
+        if Sensor._wave_cache is None:
+            xs = [Sensor.XMAX * i / (Sensor.SAMPLE_SIZE - 1) for i in range(Sensor.SAMPLE_SIZE)]
+            Sensor._wave_cache = Sensor._filtered([Sensor._func(x) for x in xs])
+        return Sensor._wave_cache
 
-        return value
+    @staticmethod
+    def _noise_table(seed):
+        table = Sensor._noise_cache.get(seed)
+        if table is None:
+            # Box-Muller, both deviates of each pair are used
+            uniform = Sensor._uniforms(seed)
+            deviates = []
+            while len(deviates) < Sensor.NOISE_SIZE:
+                u = next(uniform)
+                if u > 0.0:
+                    f = math.sqrt(-2 * math.log(u))
+                    z = (math.pi * 2) * next(uniform)
+                    deviates.append(f * math.cos(z))
+                    deviates.append(f * math.sin(z))
+            table = Sensor._filtered(deviates[:Sensor.NOISE_SIZE])
+            Sensor._noise_cache[seed] = table
+        return table
+
+    # Uniform deviates in [0, 1) from an xorshift32 generator of the mock's own. Seeding the random module instead
+    # would reset the sequence everything else draws from, and CircuitPython has no random.Random to keep apart.
+    @staticmethod
+    def _uniforms(seed):
+        state = (seed & 0xFFFFFFFF) or 1
+        while True:
+            state ^= (state << 13) & 0xFFFFFFFF
+            state ^= state >> 17
+            state ^= (state << 5) & 0xFFFFFFFF
+            yield state / 4294967296
+
+    # The SG filter is linear, so filtering the periodic tables once gives exactly what filtering every window of
+    # the repeating sequence would. Output i is the filtered window ending at sample i.
+    @staticmethod
+    def _filtered(values):
+        weights = SGPointFilter.weights(Sensor.FILTER_NL, Sensor.FILTER_NR)
+        n = len(values)
+        size = len(weights)
+        table = array('f', [0.0] * n)
+        for i in range(n):
+            value = 0.0
+            for k in range(size):
+                value += weights[k] * values[(i - size + 1 + k) % n]
+            table[i] = value
+        return table
 
     @staticmethod
     def _gauss(x, w, xa):
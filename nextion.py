@@ -0,0 +1,188 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Renders Nextion commands into one preallocated buffer, shared by every gauge on the UART.
+#
+# Commands are built up in place with put/put_int/put_fixed and closed off with end(), which appends the 0xFF 0xFF
+# 0xFF terminator. Commands that the panel must not see yet are queued with defer() and a "not before" timestamp, and
+# a command already queued is not queued twice. flush() releases the deferred commands that are due, then sends what
+# is pending in a single uart.write. The write blocks until the bytes are out, so with max_write set a flush sends at
+# most that many bytes and leaves the rest for the next one, bounding the time any one flush holds up the tasks behind
+# it. Running out of room never forces the whole buffer out either, see _reserve.
+class CommandBuffer:
+
+    SIZE = 256
+    DEFER_SLOTS = 8
+    TERMINATOR = b"\xff\xff\xff"
+
+    def __init__(self, uart, size=SIZE, max_write=None):
+        self._uart = uart
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._n = 0
+        self._sent = 0  # bytes of the buffer already written
+        self._max_write = max_write if max_write else size
+        self._writes = 0
+        self._bytes = 0
+
+        # FIFO of deferred commands and their release timestamps
+        self._deferred = [None] * CommandBuffer.DEFER_SLOTS
+        self._deferred_at = [0] * CommandBuffer.DEFER_SLOTS
+        self._deferred_head = 0
+        self._deferred_count = 0
+        self._coalesced = 0
+
+    @property
+    def writes(self):
+        return self._writes
+
+    @property
+    def bytes_written(self):
+        return self._bytes
+
+    def command(self, data):
+        self.put(data)
+        self.end()
+
+    def put(self, data):
+        k = len(data)
+        self._reserve(k)
+        self._buf[self._n:self._n + k] = data
+        self._n += k
+
+    def put_int(self, value):
+        self.put_fixed(value, 1, 0)
+
+    # Equivalent to "{:0{width}.{decimals}f}".format(value) for non-negative values, zero padded on the left. Halves
+    # are rounded up, so a value exactly halfway in binary, e.g. 0.125 to two decimals, can differ from format's
+    # round-half-even.
+    def put_fixed(self, value, width, decimals):
+        scale = 1
+        for _ in range(decimals):
+            scale *= 10
+        scaled = int(value * scale + 0.5)
+
+        whole = scaled // scale
+        digits = 1
+        while whole >= 10:
+            whole //= 10
+            digits += 1
+        length = digits + 1 + decimals if decimals else digits
+        if length < width:
+            length = width
+
+        self._reserve(length)
+        buf = self._buf
+        start = self._n
+        i = start + length - 1
+        for _ in range(decimals):
+            buf[i] = 0x30 + scaled % 10
+            scaled //= 10
+            i -= 1
+        if decimals:
+            buf[i] = 0x2E  # '.'
+            i -= 1
+        while i >= start:
+            buf[i] = 0x30 + scaled % 10
+            scaled //= 10
+            i -= 1
+        self._n += length
+
+    def end(self):
+        self.put(CommandBuffer.TERMINATOR)
+
+    def defer(self, data, not_before):
+        # A command that is already waiting is sent once, at the later of the two times, e.g. the ref_star of two
+        # gauges whose dials refreshed together
+        for k in range(self._deferred_count):
+            i = (self._deferred_head + k) % CommandBuffer.DEFER_SLOTS
+            if self._deferred[i] == data:
+                if not_before > self._deferred_at[i]:
+                    self._deferred_at[i] = not_before
+                self._coalesced += 1
+                return
+
+        # If the queue is full, release the oldest command early rather than lose it
+        if self._deferred_count == CommandBuffer.DEFER_SLOTS:
+            self._release()
+        i = (self._deferred_head + self._deferred_count) % CommandBuffer.DEFER_SLOTS
+        self._deferred[i] = data
+        self._deferred_at[i] = not_before
+        self._deferred_count += 1
+
+    @property
+    def deferred(self):
+        return self._deferred_count
+
+    @property
+    def coalesced(self):
+        return self._coalesced
+
+    def flush(self, timestamp):
+        while self._deferred_count and self._deferred_at[self._deferred_head] <= timestamp:
+            self._release()
+        self._write(self._max_write)
+
+    def _release(self):
+        i = self._deferred_head
+        self.command(self._deferred[i])
+        self._deferred[i] = None
+        self._deferred_head = (i + 1) % CommandBuffer.DEFER_SLOTS
+        self._deferred_count -= 1
+
+    def _write(self, limit):
+        end = self._n
+        if end - self._sent > limit:
+            end = self._sent + limit
+        if end > self._sent:
+            self._uart.write(self._view[self._sent:end])
+            self._writes += 1
+            self._bytes += end - self._sent
+            self._sent = end
+        if self._sent == self._n:
+            self._sent = 0
+            self._n = 0
+
+    # Make room for k more bytes. The unsent bytes are moved down to the front of the buffer first, and only if that
+    # is not enough is the shortfall written out, so an overflow blocks for no more than the one command's worth.
+    def _reserve(self, k):
+        if self._n + k <= len(self._buf):
+            return
+        self._compact()
+        if self._n + k > len(self._buf):
+            self._write(self._n + k - len(self._buf))
+            self._compact()
+
+    # Forward byte copy rather than a slice assignment, the source and destination overlap
+    def _compact(self):
+        if not self._sent:
+            return
+        buf = self._buf
+        j = self._sent
+        for i in range(self._n - self._sent):
+            buf[i] = buf[j]
+            j += 1
+        self._n -= self._sent
+        self._sent = 0
@@ -22,8 +22,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from ncd_pr33_15.receiver import Receiver, GAIN_2X, SAMPLE_RATE_12_BIT, SAMPLE_RATE_16_BIT
-from sgfilter import SGFilter
+from ncd_pr33_15.receiver import SAMPLE_RATE_12_BIT, SAMPLE_RATE_16_BIT
 
 """
 
@@ -95,9 +94,6 @@ cf_12 = 0 - ((0.009648913191 * 1826.6305905963) - 15) = -2.6250000007
 
 class Sensor:
 
-    # We can do a max of 15 samples/sec at 16-bits, so lets try 10/s to give ourselves breathing room.
-    SAMPLE_FREQ = 100000
-
     TEMP_M_16 = 0.006412563919
     FLOW_M_16 = 0.0006027810084
     TEMP_C_16 = -62.5000000055
@@ -125,9 +121,11 @@ class Sensor:
     CH_3 = 2
     CH_4 = 3
 
-    def __init__(self, i2c, flow_ch, temp_ch):
-        self._t1 = 0
-        self._receiver = self._create_receiver(i2c)
+    def __init__(self, adc, flow_ch, temp_ch, capture=None):
+        self._adc = adc
+        self._capture = capture  # a Capture that every new raw code is also streamed to
+        self._flow_count = 0
+        self._temp_count = 0
         self._flow_ch = flow_ch
         self._temp_ch = temp_ch
         self._flow = 0
@@ -139,38 +137,46 @@ class Sensor:
         return
 
     def tick(self, timestamp):
-        if timestamp - self._t1 > self.SAMPLE_FREQ:
-            self._t1 = timestamp
+        count = self._adc.count(self._flow_ch)
+        if count != self._flow_count:
+            self._flow_count = count
             self._flow = self._read_flow()
+            if self._capture is not None:
+                self._capture.record(timestamp, self._flow_ch, self._adc.value(self._flow_ch))
+
+        count = self._adc.count(self._temp_ch)
+        if count != self._temp_count:
+            self._temp_count = count
             self._temp = self._read_temp()
+            if self._capture is not None:
+                self._capture.record(timestamp, self._temp_ch, self._adc.value(self._temp_ch))
 
     @property
     def temperature(self):
         return self._temp
 
+    @property
+    def raw_flow(self):
+        return self._adc.value(self._flow_ch)
+
     @property
     def flow_rate(self):
         return self._flow
 
+    # Unfiltered codes are too noisy to differentiate, so the shut-off predictor goes on the flow alone
+    @property
+    def flow_slope(self):
+        return 0.0
+
     def _read_temp(self):    
-        self._receiver.channel = self._temp_ch
         # Read the next filtered value
-        raw = self._receiver.raw_value()
+        raw = self._adc.value(self._temp_ch)
         temp = (Sensor.TEMP_M * raw) + Sensor.TEMP_C
         return temp if temp > 0 else 0
 
     def _read_flow(self):
 
-        self._receiver.channel = self._flow_ch
         # Read the next filtered value
-        raw = self._receiver.raw_value()
+        raw = self._adc.value(self._flow_ch)
         flow = (Sensor.FLOW_M * raw) + Sensor.FLOW_C        
         return flow if flow > 1 else 0
-
-    @staticmethod
-    def _create_receiver(i2c):
-        receiver = Receiver(i2c)
-        receiver.gain = GAIN_2X
-        receiver.sample_rate = Sensor.SAMPLE_RATE
-        receiver.continuous = True
-        return receiver
@@ -0,0 +1,171 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import mmap
+import struct
+from array import array
+
+from capture import Capture
+from sensor import Sensor
+
+
+# Feeds recorded conversions to a Sensor in place of the ReceiverScheduler
+class ReplayReceiver:
+
+    def __init__(self):
+        self._values = array('h', [0] * 4)
+        self._counts = array('L', [0] * 4)
+
+    def value(self, ch):
+        return self._values[ch]
+
+    def count(self, ch):
+        return self._counts[ch]
+
+    def convert(self, ch, code):
+        self._values[ch] = code
+        self._counts[ch] += 1
+
+
+# Plays a capture file (see capture.py) back through the real Sensor filtering, for tuning on the desktop.
+#
+# The file is memory-mapped and walked one record at a time, so a multi-hour capture replays in constant memory.
+# tick() releases the records whose capture time has been reached, at speed times real time. step() releases the
+# next record regardless of time, for replaying as fast as possible. Only available on desktop CPython (mmap).
+#
+# The board sends the header again whenever the host reconnects, so a header can also turn up between records. It is
+# skipped and the records after it carry on from where the last ones left off, whatever their timestamps. reset() is
+# a no-op like Sensor.reset(), the controller calls it on every reset; rewind() starts the capture over.
+class ReplaySensor:
+
+    HEADER_SIZE = struct.calcsize(Capture.HEADER)
+    WRAP_US = 1 << 32
+
+    # Any filters, e.g. flow_filter=EMAFilter(), are passed on to the sensor
+    def __init__(self, path, flow_ch, temp_ch, speed=1.0, sensor=Sensor, **filters):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < ReplaySensor.HEADER_SIZE:
+            raise ValueError("{} is not a capture".format(path))
+        magic, version, sample_rate = struct.unpack_from(Capture.HEADER, self._map, 0)
+        if magic != Capture.MAGIC or version != Capture.VERSION:
+            raise ValueError("{} is not a version {} capture".format(path, Capture.VERSION))
+        if sample_rate != sensor.SAMPLE_RATE:
+            raise ValueError("{} was captured at sample rate {}, the sensor expects {}".format(
+                path, sample_rate, sensor.SAMPLE_RATE))
+
+        self._sample_rate = sample_rate
+        self._flow_ch = flow_ch
+        self._temp_ch = temp_ch
+        self._speed = speed
+        self._receiver = ReplayReceiver()
+        self._sensor = sensor(self._receiver, flow_ch, temp_ch, **filters)
+        self.rewind()
+
+    def reset(self):
+        return
+
+    def rewind(self):
+        self._offset = 0
+        self._start = None  # timestamp of the first tick
+        self._last_raw = None  # timestamp of the last record released, None at the start of the capture or a segment
+        self._last_us = 0  # capture time of the last record released, in us from the first
+        self._skip_headers()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    @property
+    def done(self):
+        return self._offset + Capture.RECORD_SIZE > len(self._map)
+
+    # Capture time of the last record released, in us from the first
+    @property
+    def position(self):
+        return self._last_us
+
+    def tick(self, timestamp):
+        if self._start is None:
+            self._start = timestamp
+        until = (timestamp - self._start) * self._speed / 1000
+        while not self.done and self._peek() <= until:
+            self._release(timestamp)
+
+    def step(self, timestamp=0):
+        if self.done:
+            return False
+        self._release(timestamp)
+        return True
+
+    @property
+    def temperature(self):
+        return self._sensor.temperature
+
+    @property
+    def raw_flow(self):
+        return self._sensor.raw_flow
+
+    @property
+    def flow_rate(self):
+        return self._sensor.flow_rate
+
+    @property
+    def flow_slope(self):
+        return self._sensor.flow_slope
+
+    @property
+    def flow_filter(self):
+        return self._sensor.flow_filter
+
+    @property
+    def temp_filter(self):
+        return self._sensor.temp_filter
+
+    # Capture time of the next record, in us from the first. The 32-bit timestamps are unwrapped by taking the step
+    # from the last record modulo 2^32.
+    def _peek(self):
+        raw = struct.unpack_from("<I", self._map, self._offset)[0]
+        if self._last_raw is None:
+            return self._last_us
+        return self._last_us + (raw - self._last_raw) % ReplaySensor.WRAP_US
+
+    def _release(self, timestamp):
+        self._last_us = self._peek()
+        self._last_raw, ch, code = struct.unpack_from(Capture.RECORD, self._map, self._offset)
+        self._offset += Capture.RECORD_SIZE
+        if ch == self._flow_ch or ch == self._temp_ch:
+            self._receiver.convert(ch, code)
+            self._sensor.tick(timestamp)
+        self._skip_headers()
+
+    # Step over any headers at the current offset, each one starting a new segment. A record only reads as a header
+    # if its timestamp spells the magic and its channel and code match the version and sample rate as well.
+    def _skip_headers(self):
+        while self._offset + ReplaySensor.HEADER_SIZE <= len(self._map):
+            magic, version, sample_rate = struct.unpack_from(Capture.HEADER, self._map, self._offset)
+            if magic != Capture.MAGIC or version != Capture.VERSION or sample_rate != self._sample_rate:
+                return
+            self._offset += ReplaySensor.HEADER_SIZE
+            self._last_raw = None
@@ -0,0 +1,81 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from array import array
+
+
+# A fixed capacity sample window, allocated once and overwritten in place.
+#
+# Index 0 is always the oldest sample. The backing array and the position of the oldest sample are exposed as
+# data and head so that filters can walk the window without going through __getitem__.
+class RingBuffer:
+
+    def __init__(self, capacity, typecode='f'):
+        self.data = array(typecode, [0] * capacity)
+        self.capacity = capacity
+        self.head = 0
+        self._count = 0
+
+    def reset(self):
+        self.head = 0
+        self._count = 0
+
+    def push(self, value):
+        if self._count < self.capacity:
+            self.data[self._count] = value
+            self._count += 1
+        else:
+            self.data[self.head] = value
+            self.head += 1
+            if self.head == self.capacity:
+                self.head = 0
+
+    @property
+    def full(self):
+        return self._count == self.capacity
+
+    @property
+    def fill(self):
+        return self._count / self.capacity
+
+    def mean(self):
+        if self._count == 0:
+            return 0.0
+        total = 0.0
+        for i in range(self._count):
+            total += self.data[i]
+        return total / self._count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if i < 0 or i >= self._count:
+            raise IndexError("ring index out of range")
+        i += self.head
+        if i >= self.capacity:
+            i -= self.capacity
+        return self.data[i]
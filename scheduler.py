@@ -0,0 +1,143 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import time
+
+
+class Task:
+
+    def __init__(self, name, callback, period, priority, deadline):
+        self.name = name
+        self.callback = callback
+        self.period = period
+        self.priority = priority
+        self.deadline = deadline
+
+        self.runs = 0
+        self.missed = 0  # whole periods skipped because the task ran late
+        self.max_jitter = 0  # worst lateness against the deadline, in ns
+        self.total_jitter = 0
+
+    # Run the task and move its deadline on one period, keeping its phase. If it overran whole periods, they are
+    # counted as missed and skipped.
+    def run(self, now):
+        lateness = now - self.deadline
+        self.callback(now)
+        self.runs += 1
+        self.total_jitter += lateness
+        if lateness > self.max_jitter:
+            self.max_jitter = lateness
+
+        self.deadline += self.period
+        if self.deadline <= now:
+            behind = (now - self.deadline) // self.period + 1
+            self.missed += behind
+            self.deadline += behind * self.period
+
+    def before(self, other):
+        if self.deadline == other.deadline:
+            return self.priority < other.priority
+        return self.deadline < other.deadline
+
+
+def report(tasks):
+    for task in tasks:
+        mean = task.total_jitter // task.runs if task.runs else 0
+        print("{}: runs={} missed={} jitter mean={}ns max={}ns".format(
+            task.name, task.runs, task.missed, mean, task.max_jitter))
+
+
+# A cooperative deadline scheduler for periodic tasks.
+#
+# Tasks are kept in a binary min-heap on (deadline, priority), a lower priority number runs first when deadlines
+# coincide. run() sleeps until the earliest deadline, calls the task with the current timestamp and puts it back on
+# the heap at its next deadline. Slack before a deadline can be handed to an idle hook first, e.g. to collect garbage.
+class Scheduler:
+
+    def __init__(self, idle=None, idle_min_ns=0):
+        self._heap = []
+        self._running = False
+
+        # Called as idle(timestamp, slack) when there are at least idle_min_ns before the next deadline
+        self._idle = idle
+        self._idle_min_ns = idle_min_ns
+
+    def add(self, name, callback, period, priority=0, start=None):
+        if start is None:
+            start = time.monotonic_ns()
+        task = Task(name, callback, period, priority, start)
+        self._heap.append(task)
+        self._sift_up(len(self._heap) - 1)
+        return task
+
+    def stop(self):
+        self._running = False
+
+    def run(self):
+        self._running = True
+        while self._running:
+            self.run_next()
+
+    def run_next(self):
+        task = self._heap[0]
+        now = time.monotonic_ns()
+        if now < task.deadline:
+            if self._idle is not None and task.deadline - now >= self._idle_min_ns:
+                self._idle(now, task.deadline - now)
+                now = time.monotonic_ns()
+            if now < task.deadline:
+                time.sleep((task.deadline - now) / 1000000000)
+                now = time.monotonic_ns()
+        task.run(now)
+        self._sift_down(0)
+
+    def report(self):
+        report(self._heap)
+
+    def _sift_up(self, i):
+        heap = self._heap
+        task = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not task.before(heap[parent]):
+                break
+            heap[i] = heap[parent]
+            i = parent
+        heap[i] = task
+
+    def _sift_down(self, i):
+        heap = self._heap
+        n = len(heap)
+        task = heap[i]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and heap[child + 1].before(heap[child]):
+                child += 1
+            if not heap[child].before(task):
+                break
+            heap[i] = heap[child]
+            i = child
+        heap[i] = task
@@ -22,8 +22,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from ncd_pr33_15.receiver import Receiver, GAIN_2X, SAMPLE_RATE_12_BIT, SAMPLE_RATE_16_BIT
-from sgfilter import SGFilter
+from ncd_pr33_15.receiver import SAMPLE_RATE_12_BIT, SAMPLE_RATE_16_BIT
+from filters import SGFilter
 
 """
 
@@ -95,9 +95,6 @@ cf_12 = 0 - ((0.009648913191 * 1826.6305905963) - 15) = -2.6250000007
 
 class Sensor:
 
-    # We can do a max of 15 samples/sec at 16-bits, so lets try 10/s to give ourselves breathing room.
-    SAMPLE_FREQ = 100000
-
     TEMP_M_16 = 0.006412563919
     FLOW_M_16 = 0.0006027810084
     TEMP_C_16 = -62.5000000055
@@ -120,93 +117,149 @@ class Sensor:
     TEMP_C = TEMP_C_12
     FLOW_C = FLOW_C_12
 
-    TEMP_BUFFER_SIZE = 30
-    FLOW_BUFFER_SIZE = 15
+    # The transmitter bottoms out at 4mA below its minimum flow, so codes under FLOW_MIN are taken as no flow at all
+    # before filtering. Otherwise the filters ring between ~0.9 L/min and the flow across every open and close, and
+    # the reading over-counts each pour by the floor held above the cutoff.
+    FLOW_MIN = 1  # L/min
+    FLOW_MIN_RAW = (FLOW_MIN - FLOW_C) / FLOW_M
+    FLOW_ZERO_RAW = round(-FLOW_C / FLOW_M)  # code that reads 0 L/min
+
+    # Default filters, for any channel not given one of its own. Flow and temperature are read from the centre of a
+    # Savitzky-Golay window, and the flow's rate of change from the newest end of a quadratic fit.
+    FLOW_WINDOW = 15  # samples either side of the centre, so 15 samples of delay
+    TEMP_WINDOW = 30
+    SLOPE_WINDOW = 31  # samples in all, with no delay
 
     CH_1 = 0
     CH_2 = 1
     CH_3 = 2
     CH_4 = 3
 
-    def __init__(self, i2c, flow_ch, temp_ch):
-        self._t1 = 0
-        self._receiver = self._create_receiver(i2c)
+    # flow_filter, temp_filter and slope_filter are engines from filters.py, e.g. EMAFilter() or MedianFilter(5)
+    def __init__(self, adc, flow_ch, temp_ch, capture=None, flow_filter=None, temp_filter=None, slope_filter=None):
+        self._adc = adc
+        self._capture = capture  # a Capture that every new raw code is also streamed to
+        self._flow_count = 0  # adc conversion count of the last sample taken from each channel
+        self._temp_count = 0
+        self._samples = 0
+        self._duplicates = 0
         self._flow_ch = flow_ch
         self._temp_ch = temp_ch
         self._flow = 0
+        self._flow_slope = 0.0
+        self._flow_at = None  # timestamp of the last flow sample
+        self._flow_interval = 0  # smoothed ns between flow samples
         self._temp = 0
 
-        self._temp_buffer = []
-        self._temp_filter = SGFilter(nr=Sensor.TEMP_BUFFER_SIZE, nl=Sensor.TEMP_BUFFER_SIZE)
-
-        self._flow_buffer = []
-        self._flow_filter = SGFilter(nr=Sensor.FLOW_BUFFER_SIZE, nl=Sensor.FLOW_BUFFER_SIZE)
+        if flow_filter is None:
+            flow_filter = SGFilter.centred(Sensor.FLOW_WINDOW)
+        if temp_filter is None:
+            temp_filter = SGFilter.centred(Sensor.TEMP_WINDOW)
+        if slope_filter is None:
+            slope_filter = SGFilter.endpoint(Sensor.SLOPE_WINDOW, ld=1)
+        self._flow_filter = flow_filter
+        self._temp_filter = temp_filter
+        self._slope_filter = slope_filter  # must give the derivative per sample, e.g. SGFilter with ld=1
 
         return
 
     def reset(self):
         return
 
+    @property
+    def flow_filter(self):
+        return self._flow_filter
+
+    @property
+    def temp_filter(self):
+        return self._temp_filter
+
     def tick(self, timestamp):
-        if timestamp - self._t1 > self.SAMPLE_FREQ:
-            self._t1 = timestamp
-            self._flow = self._read_flow()
+
+        # Only take a sample when the scheduler has a new conversion, so each window slot is a distinct conversion
+        count = self._adc.count(self._flow_ch)
+        if count != self._flow_count:
+            self._flow_count = count
+            raw = self._adc.value(self._flow_ch)
+            if raw < Sensor.FLOW_MIN_RAW:
+                raw = Sensor.FLOW_ZERO_RAW
+            self._flow = self._read_flow(raw)
+            self._flow_slope = self._read_flow_slope(timestamp, raw)
+            self._samples += 1
+            if self._capture is not None:
+                self._capture.record(timestamp, self._flow_ch, self._adc.value(self._flow_ch))
+        else:
+            self._duplicates += 1
+
+        count = self._adc.count(self._temp_ch)
+        if count != self._temp_count:
+            self._temp_count = count
             self._temp = self._read_temp()
+            self._samples += 1
+            if self._capture is not None:
+                self._capture.record(timestamp, self._temp_ch, self._adc.value(self._temp_ch))
+        else:
+            self._duplicates += 1
+
+    @property
+    def samples(self):
+        return self._samples
+
+    @property
+    def duplicates_avoided(self):
+        return self._duplicates
+
+    def report(self, name):
+        print("{} sensor: samples={} duplicates avoided={}".format(name, self._samples, self._duplicates))
+
+    @property
+    def warming(self):
+        return not (self._flow_filter.warm and self._temp_filter.warm)
 
     @property
     def temperature(self):
         return self._temp
 
+    @property
+    def raw_flow(self):
+        return self._adc.value(self._flow_ch)
+
     @property
     def flow_rate(self):
         return self._flow
 
+    # litres/min per sec
+    @property
+    def flow_slope(self):
+        return self._flow_slope
+
     def _read_temp(self):
     
-        self._receiver.channel = self._temp_ch
-
-        # Ensure that the buffer is full
-        self._fill_buffer(self._temp_buffer, Sensor.TEMP_BUFFER_SIZE, "temp", self._temp_ch)
-
         # Read the next filtered value
-        self._temp_buffer.pop(0)
-        raw = self._receiver.raw_value()
-        self._temp_buffer.append(raw)
-        filtered_data = self._temp_filter.filter(self._temp_buffer)
-        raw_filtered = filtered_data[round(Sensor.TEMP_BUFFER_SIZE/2)]
+        raw_filtered = self._temp_filter.update(self._adc.value(self._temp_ch))
         temp = (Sensor.TEMP_M * raw_filtered) + Sensor.TEMP_C
 
         return temp if temp > 0 else 0
 
-    def _read_flow(self):
-
-        self._receiver.channel = self._flow_ch
-
-        # Ensure that the buffer is full
-        self._fill_buffer(self._flow_buffer, Sensor.FLOW_BUFFER_SIZE, "flow", self._flow_ch)
+    def _read_flow(self, raw):
 
         # Read the next filtered value
-        self._flow_buffer.pop(0)
-        raw = self._receiver.raw_value()
-        self._flow_buffer.append(raw)
-        filtered_data = self._flow_filter.filter(self._flow_buffer)
-        raw_filtered = filtered_data[Sensor.FLOW_BUFFER_SIZE]
+        raw_filtered = self._flow_filter.update(raw)
         flow = (Sensor.FLOW_M * raw_filtered) + Sensor.FLOW_C
 
-        return flow if flow > 1 else 0
-
-    def _fill_buffer(self, buffer, size, name, ch):
-        if len(buffer) < (size * 2) + 1:
-            print("buffering {} on ch {}".format(name, ch), end="")
-            while len(buffer) < (size * 2) + 1:
-                print(".", end="")
-                buffer.append(self._receiver.raw_value())
-            print("")
-
-    @staticmethod
-    def _create_receiver(i2c):
-        receiver = Receiver(i2c)
-        receiver.gain = GAIN_2X
-        receiver.sample_rate = Sensor.SAMPLE_RATE
-        receiver.continuous = True
-        return receiver
+        return flow if flow > Sensor.FLOW_MIN else 0
+
+    def _read_flow_slope(self, timestamp, raw):
+
+        # The derivative comes out per sample, so scale it by the sample interval, smoothed against scheduling jitter
+        if self._flow_at is not None:
+            interval = timestamp - self._flow_at
+            if self._flow_interval:
+                self._flow_interval += (interval - self._flow_interval) // 8
+            else:
+                self._flow_interval = interval
+        self._flow_at = timestamp
+        slope = self._slope_filter.update(raw)
+        if not self._slope_filter.warm or not self._flow_interval:
+            return 0.0
+        return Sensor.FLOW_M * slope * 1000000000 / self._flow_interval
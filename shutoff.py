@@ -0,0 +1,100 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from array import array
+
+
+# Predicts how much more will flow once the valve is told to close, so it can be closed early and land on the volume.
+#
+# Everything between the decision to close and the liquid actually stopping is lumped into one latency L: the group
+# delay of the flow filter, the controller tick and the valve's mechanical close time. Over L a flow f changing at f'
+# delivers (f + f' * L / 2) * L more, and the valve is closed once the volume left is no more than that. L is held in
+# milliseconds and the prediction made in whole microlitres. L is capped at MAX_LATENCY_MS so that at up to the
+# receiver's 15 L/min (250000 uL/s), and a flow ramping up in no less than half a second (500000 uL/s^2), the largest
+# product, (250000 + 500000 * 1500 / 2000) * 1500 = 9.4e8, stays under the 2^30 small int limit and a dispensing tick
+# allocates nothing. It is still read and restored in nanoseconds, as journalled.
+#
+# L is learned online. After a close, the volume measured once the flow has stopped, less what was left at the close,
+# is the overshoot. Divided by the flow at the close it is the error in L, and a GAIN fraction of it is taken each
+# dispense, so the overshoot decays geometrically towards zero. The sensor reads no flow below its minimum, so the
+# volume it measures over the close is the volume delivered, and zero measured overshoot is zero overshoot.
+class ShutoffPredictor:
+
+    LATENCY_NS = 0  # Initial estimate, closing on the volume until the first dispense has been measured
+    MAX_LATENCY_MS = 1500
+    MAX_LATENCY_NS = MAX_LATENCY_MS * 1000000
+    GAIN = 0.5
+    HISTORY = 8  # Overshoots kept for the report
+
+    def __init__(self, latency_ns=LATENCY_NS, gain=GAIN):
+        self._latency = 0  # ms
+        self._gain = gain
+        self._overshoots = array('l', [0] * ShutoffPredictor.HISTORY)  # microlitres
+        self.dispenses = 0
+        self.latency_ns = latency_ns
+
+    @property
+    def latency_ns(self):
+        return self._latency * 1000000
+
+    # Restores a latency learned before, e.g. from NVM
+    @latency_ns.setter
+    def latency_ns(self, latency_ns):
+        self._set_latency(int(latency_ns) // 1000000)
+
+    def _set_latency(self, latency_ms):
+        latency_ms = int(latency_ms)
+        if latency_ms < 0:
+            latency_ms = 0
+        elif latency_ms > ShutoffPredictor.MAX_LATENCY_MS:
+            latency_ms = ShutoffPredictor.MAX_LATENCY_MS
+        self._latency = latency_ms
+
+    @property
+    def overshoot(self):
+        if self.dispenses == 0:
+            return 0
+        return self._overshoots[(self.dispenses - 1) % ShutoffPredictor.HISTORY]
+
+    # Microlitres still to come if the valve is closed now, given the flow in microlitres/sec and its rate of change in
+    # microlitres/sec^2
+    def remaining(self, flow_ul, slope_ul):
+        t = self._latency
+        ul = (flow_ul + slope_ul * t // 2000) * t // 1000
+        return ul if ul > 0 else 0
+
+    # Record a dispense's overshoot in microlitres (negative if it fell short) and correct the latency by it
+    def learn(self, overshoot_ul, flow_ul):
+        self._overshoots[self.dispenses % ShutoffPredictor.HISTORY] = overshoot_ul
+        self.dispenses += 1
+        if flow_ul <= 0:
+            return
+        self._set_latency(self._latency + self._gain * (overshoot_ul * 1000 // flow_ul))
+
+    def report(self, name):
+        n = min(self.dispenses, ShutoffPredictor.HISTORY)
+        start = self.dispenses - n
+        print("{} shutoff: dispenses={} latency={}ms overshoot last {}uL".format(
+            name, self.dispenses, self._latency,
+            [self._overshoots[i % ShutoffPredictor.HISTORY] for i in range(start, self.dispenses)]))
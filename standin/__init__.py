@@ -0,0 +1,77 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+import time
+import types
+
+from . import world
+from .clock import VirtualClock, SimulationEnd
+from .world import World, Station, default_world
+
+# Desktop CPython stand-ins for the CircuitPython hardware modules, so the dispenser can run off-board.
+#
+# install() puts board, busio, digitalio, microcontroller, supervisor, usb_cdc, i2c_encoder.encoder and
+# ncd_pr33_15.receiver into sys.modules and points time.monotonic_ns, time.monotonic and time.sleep at the world's
+# virtual clock. It must run before any of the dispenser modules are imported.
+
+__all__ = ["install", "VirtualClock", "SimulationEnd", "World", "Station", "default_world"]
+
+
+def install(world_=None):
+    from . import board, busio, digitalio, microcontroller, supervisor, usb_cdc, i2c_encoder, ncd_pr33_15
+
+    if world_ is None:
+        world_ = default_world()
+    world.current = world_
+    microcontroller.nvm = world_.nvm
+    usb_cdc._enable(world_)
+
+    modules = {
+        "board": board,
+        "busio": busio,
+        "digitalio": digitalio,
+        "microcontroller": microcontroller,
+        "supervisor": supervisor,
+        "usb_cdc": usb_cdc,
+        "i2c_encoder": _package("i2c_encoder", encoder=i2c_encoder),
+        "i2c_encoder.encoder": i2c_encoder,
+        "ncd_pr33_15": _package("ncd_pr33_15", receiver=ncd_pr33_15),
+        "ncd_pr33_15.receiver": ncd_pr33_15,
+    }
+    sys.modules.update(modules)
+
+    clock = world_.clock
+    time.monotonic_ns = clock.monotonic_ns
+    time.monotonic = clock.monotonic
+    time.sleep = clock.sleep
+    return world_
+
+
+def _package(name, **submodules):
+    package = types.ModuleType(name)
+    package.__path__ = []
+    for key, module in submodules.items():
+        setattr(package, key, module)
+    return package
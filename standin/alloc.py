@@ -0,0 +1,186 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import dis
+import os
+import sys
+
+# Counts the heap allocations MicroPython would make running the dispenser's code, which CPython cannot show:
+# tracemalloc sees every int past 256 and none of the objects CPython recycles through its free lists.
+#
+# run() traces the opcodes and builtin calls of the modules that run on the board (and any extra code objects given),
+# and counts an allocation where MicroPython would make a heap object:
+#   - building a tuple, list, set, dict, slice, string or closure, and formatting a value
+#   - calling any builtin, e.g. str.format, bytes, list.append, pow or range
+#   - long int arithmetic: values fed in as LongInt count each result worked from them, and any local or returned int
+#     outside the small int range counts too (one made and dropped inside an expression is missed)
+#   - float arithmetic, with boxed_floats, on values fed in as Float. The ports with immediate floats pay nothing.
+
+SMALL_INT = 1 << 30
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+ALLOCATING_OPCODES = {dis.opmap[name] for name in (
+    "BUILD_TUPLE", "BUILD_LIST", "BUILD_SET", "BUILD_MAP", "BUILD_CONST_KEY_MAP", "BUILD_STRING", "BUILD_SLICE",
+    "FORMAT_VALUE", "LIST_APPEND", "LIST_EXTEND", "SET_ADD", "MAP_ADD", "DICT_UPDATE", "MAKE_FUNCTION")}
+
+counter = None  # the AllocationCounter running, which LongInt and Float count against
+
+
+# The source files that run on the board, not the stand-ins, tests or tools
+def on_board(code):
+    return os.path.dirname(os.path.normpath(code.co_filename)) == ROOT
+
+
+class AllocationCounter:
+
+    def __init__(self, also=(), boxed_floats=False):
+        self.sites = {}  # (file, line, what) -> allocations
+        self.opcodes = 0  # executed in the traced code
+        self.boxed_floats = boxed_floats
+        self._also = also  # code objects to count in as well as the dispenser's
+
+    def count(self, frame, what):
+        key = (os.path.basename(frame.f_code.co_filename), frame.f_lineno, what)
+        self.sites[key] = self.sites.get(key, 0) + 1
+
+    def total(self):
+        return sum(self.sites.values())
+
+    def run(self, callback, *args):
+        global counter
+        counter = self
+        sys.settrace(self._call)
+        sys.setprofile(self._profile)
+        try:
+            return callback(*args)
+        finally:
+            sys.setprofile(None)
+            sys.settrace(None)
+            counter = None
+
+    def _traced(self, code):
+        return on_board(code) or code in self._also
+
+    def _call(self, frame, event, arg):
+        if not self._traced(frame.f_code):
+            return None
+        frame.f_trace_opcodes = True
+        return self._trace
+
+    def _trace(self, frame, event, arg):
+        if event == "opcode":
+            self.opcodes += 1
+            op = frame.f_code.co_code[frame.f_lasti]
+            if op in ALLOCATING_OPCODES:
+                self.count(frame, dis.opname[op])
+        elif event == "line":
+            for name, value in frame.f_locals.items():
+                if type(value) is int and not -SMALL_INT <= value < SMALL_INT:
+                    self.count(frame, "long int " + name)
+        elif event == "return":
+            if type(arg) is int and not -SMALL_INT <= arg < SMALL_INT:
+                self.count(frame, "long int returned")
+        return self._trace
+
+    def _profile(self, frame, event, arg):
+        if event == "c_call" and self._traced(frame.f_code):
+            self.count(frame, getattr(arg, "__qualname__", repr(arg)))
+
+
+def _made(what, value):
+    if counter is not None and (what == "long int arithmetic" or counter.boxed_floats):
+        # Counted against the line that did the arithmetic, past the operator and this call
+        counter.count(sys._getframe(2), what)
+    if isinstance(value, float):
+        return Float(value)
+    return LongInt(value)
+
+
+# An int as the board holds one past 2^30, e.g. a monotonic_ns() timestamp. Arithmetic on one makes another.
+class LongInt(int):
+
+    def __add__(self, other):
+        return _made("long int arithmetic", int(self) + _plain(other))
+
+    def __radd__(self, other):
+        return _made("long int arithmetic", _plain(other) + int(self))
+
+    def __sub__(self, other):
+        return _made("long int arithmetic", int(self) - _plain(other))
+
+    def __rsub__(self, other):
+        return _made("long int arithmetic", _plain(other) - int(self))
+
+    def __mul__(self, other):
+        return _made("long int arithmetic", int(self) * _plain(other))
+
+    def __rmul__(self, other):
+        return _made("long int arithmetic", _plain(other) * int(self))
+
+    def __floordiv__(self, other):
+        return _made("long int arithmetic", int(self) // _plain(other))
+
+    def __truediv__(self, other):
+        return _made("long int arithmetic", int(self) / _plain(other))
+
+    def __mod__(self, other):
+        return _made("long int arithmetic", int(self) % _plain(other))
+
+
+# A float as a port without immediate floats holds one. Arithmetic on one makes another.
+class Float(float):
+
+    def __add__(self, other):
+        return _made("float arithmetic", float(self) + _plain(other))
+
+    def __radd__(self, other):
+        return _made("float arithmetic", _plain(other) + float(self))
+
+    def __sub__(self, other):
+        return _made("float arithmetic", float(self) - _plain(other))
+
+    def __rsub__(self, other):
+        return _made("float arithmetic", _plain(other) - float(self))
+
+    def __mul__(self, other):
+        return _made("float arithmetic", float(self) * _plain(other))
+
+    def __rmul__(self, other):
+        return _made("float arithmetic", _plain(other) * float(self))
+
+    def __truediv__(self, other):
+        return _made("float arithmetic", float(self) / _plain(other))
+
+    def __rtruediv__(self, other):
+        return _made("float arithmetic", _plain(other) / float(self))
+
+    def __neg__(self):
+        return _made("float arithmetic", -float(self))
+
+
+def _plain(value):
+    if isinstance(value, float):
+        return float(value)
+    if isinstance(value, int):
+        return int(value)
+    return value
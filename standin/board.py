@@ -0,0 +1,52 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Stand-in for the board module. Pins are just their names.
+
+SCL = "SCL"
+SDA = "SDA"
+TX = "TX"
+RX = "RX"
+
+D0 = "D0"
+D1 = "D1"
+D2 = "D2"
+D3 = "D3"
+D4 = "D4"
+D5 = "D5"
+D6 = "D6"
+D7 = "D7"
+D8 = "D8"
+D9 = "D9"
+D10 = "D10"
+D11 = "D11"
+D12 = "D12"
+D13 = "D13"
+
+A0 = "A0"
+A1 = "A1"
+A2 = "A2"
+A3 = "A3"
+A4 = "A4"
+A5 = "A5"
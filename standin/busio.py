@@ -0,0 +1,168 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import errno
+
+from . import world
+
+# Stand-ins for busio.I2C and busio.UART. Every transfer spends the time it would take on the wire on the virtual
+# clock and is counted, so bus load can be read off after a run.
+
+
+class I2C:
+
+    # Fixed cost of one transaction in the driver and the peripheral set-up, on top of the bits on the wire
+    SETUP_NS = 20000
+
+    def __init__(self, scl, sda, *, frequency=100000, timeout=255):
+        self.frequency = frequency
+        self.transactions = 0
+        self.bytes = 0
+        self.busy_ns = 0
+        self.by_address = {}  # address -> transactions
+        self._locked = False
+        self._world = world.current
+        self._world.buses.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.deinit()
+
+    def deinit(self):
+        pass
+
+    def try_lock(self):
+        if self._locked:
+            return False
+        self._locked = True
+        return True
+
+    def unlock(self):
+        self._locked = False
+
+    def scan(self):
+        return sorted(self._world.devices)
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        device = self._transaction(address, len(buffer[start:end]), 1)
+        device.write(bytes(buffer[start:end]))
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None):
+        view = memoryview(buffer)[start:end]
+        device = self._transaction(address, len(view), 1)
+        device.read(view)
+
+    def writeto_then_readfrom(self, address, buffer_out, buffer_in, *, out_start=0, out_end=None, in_start=0,
+                              in_end=None):
+        data = bytes(buffer_out[out_start:out_end])
+        view = memoryview(buffer_in)[in_start:in_end]
+        device = self._transaction(address, len(data) + len(view), 2)
+        device.write(data)
+        device.read(view)
+
+    # Start, the address byte for each (repeated) start, the data bytes (each with its ack) and stop
+    def _transaction(self, address, nbytes, starts):
+        if not self._locked:
+            raise RuntimeError("Function requires lock")
+        bits = 2 + 9 * (starts + nbytes)
+        ns = I2C.SETUP_NS + bits * 1000000000 // self.frequency
+        self.transactions += 1
+        self.bytes += nbytes
+        self.busy_ns += ns
+        self.by_address[address] = self.by_address.get(address, 0) + 1
+        self._world.clock.advance(ns)
+        device = self._world.devices.get(address)
+        if device is None:
+            raise OSError(errno.ENODEV, "No I2C device at address: 0x{:x}".format(address))
+        if self.frequency > device.MAX_FREQUENCY:
+            # The device cannot keep up, so it never acknowledges
+            raise OSError(errno.EIO, "I2C device at 0x{:x} supports {}Hz at most".format(address, device.MAX_FREQUENCY))
+        return device
+
+
+# The UART write blocks until the bytes have been shifted out, ten bits each (8N1), and feeds them to the panel.
+class UART:
+
+    def __init__(self, tx, rx, *, baudrate=9600, bits=8, parity=None, stop=1, timeout=1, receiver_buffer_size=64):
+        self.baudrate = baudrate
+        self.writes = 0
+        self.bytes = 0
+        self.busy_ns = 0
+        self._bits_per_byte = 1 + bits + stop + (1 if parity is not None else 0)
+        self._world = world.current
+        self._world.uarts.append(self)
+        self.panel = Panel()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.deinit()
+
+    def deinit(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        return 0
+
+    def read(self, nbytes=None):
+        return None
+
+    def write(self, buf):
+        n = len(buf)
+        ns = n * self._bits_per_byte * 1000000000 // self.baudrate
+        self.writes += 1
+        self.bytes += n
+        self.busy_ns += ns
+        self.panel.feed(buf)
+        self._world.clock.advance(ns)
+        return n
+
+
+# The receiving end of the display UART. Splits the byte stream on the 0xFF 0xFF 0xFF terminator and keeps the last
+# value assigned to each attribute, e.g. attributes["vol0.txt"] == '"1.25 L"'.
+class Panel:
+
+    TERMINATOR = b"\xff\xff\xff"
+
+    def __init__(self):
+        self.commands = 0
+        self.attributes = {}
+        self._pending = bytearray()
+
+    def feed(self, data):
+        self._pending += data
+        while True:
+            i = self._pending.find(Panel.TERMINATOR)
+            if i < 0:
+                break
+            command = bytes(self._pending[:i]).decode("iso-8859-1")
+            del self._pending[:i + len(Panel.TERMINATOR)]
+            self.commands += 1
+            name, sep, value = command.partition("=")
+            if sep:
+                self.attributes[name] = value
@@ -0,0 +1,78 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import heapq
+
+
+class SimulationEnd(Exception):
+    pass
+
+
+# A virtual nanosecond clock that only moves when something spends time.
+#
+# The stand-in peripherals advance it by the time their transfers take and time.sleep() advances it by the requested
+# amount, so hours of operation run as fast as the code can execute. Callbacks can be scheduled at a virtual time and
+# run as the clock passes it. SimulationEnd is raised once the clock reaches end_ns.
+class VirtualClock:
+
+    def __init__(self, start_ns=0, end_ns=None):
+        self._now = start_ns
+        self._end = end_ns
+        self._timers = []
+        self._seq = 0
+
+    @property
+    def end_ns(self):
+        return self._end
+
+    @end_ns.setter
+    def end_ns(self, end_ns):
+        self._end = end_ns
+
+    def monotonic_ns(self):
+        return self._now
+
+    def monotonic(self):
+        return self._now / 1000000000
+
+    def sleep(self, secs):
+        self.advance(int(secs * 1000000000))
+
+    def at(self, timestamp, callback):
+        heapq.heappush(self._timers, (timestamp, self._seq, callback))
+        self._seq += 1
+
+    def after(self, ns, callback):
+        self.at(self._now + ns, callback)
+
+    def advance(self, ns):
+        target = self._now + max(ns, 0)
+        while self._timers and self._timers[0][0] <= target:
+            timestamp, _, callback = heapq.heappop(self._timers)
+            if timestamp > self._now:
+                self._now = timestamp
+            callback(self._now)
+        self._now = target
+        if self._end is not None and self._now >= self._end:
+            raise SimulationEnd()
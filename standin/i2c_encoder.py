@@ -0,0 +1,211 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import struct
+
+# Register-level stand-in for the I2C Encoder V2 and the i2c_encoder.encoder driver that talks to it.
+
+REG_GCONF = 0x00
+REG_GP1CONF = 0x01
+REG_ESTATUS = 0x05
+REG_CVAL = 0x08
+REG_CMAX = 0x0C
+REG_CMIN = 0x10
+REG_ISTEP = 0x14
+REG_RLED = 0x18
+REG_GLED = 0x19
+REG_BLED = 0x1A
+REG_GP1REG = 0x1B
+REG_DPPERIOD = 0x1F
+REGISTERS = 0x30
+
+GCONF_DTYPE = 0x01  # values are floats
+GCONF_WRAPE = 0x02
+GCONF_ETYPE = 0x20  # RGB encoder
+GCONF_RESET = 0x80
+
+ESTATUS_PUSHD = 1 << 2  # double push
+ESTATUS_RINC = 1 << 3
+ESTATUS_RDEC = 1 << 4
+
+PRESS_NS = 200000000
+
+
+# The encoder board. The master writes a register address followed by data, or a register address and then reads;
+# either way the address auto-increments. ESTATUS clears on read. 32-bit values are big-endian.
+#
+# rotate(), click() and double_click() are the operator's side of the encoder.
+class EncoderDevice:
+
+    MAX_FREQUENCY = 400000  # from the datasheet, the stand-in only refuses faster clocks, it cannot validate real ones
+
+    def __init__(self, world):
+        self._world = world
+        self._regs = bytearray(REGISTERS)
+        self._pointer = 0
+        self.writes = 0
+        self.reads = 0
+        self.leds = []  # (r, g, b) after each write that reached the LED registers, oldest first
+        self._reset()
+
+    def _reset(self):
+        for i in range(REGISTERS):
+            self._regs[i] = 0
+        self._regs[REG_GP1REG] = 1
+
+    def write(self, data):
+        self.writes += 1
+        if not data:
+            return
+        self._pointer = data[0]
+        led = False
+        for b in data[1:]:
+            if self._pointer == REG_GCONF and b & GCONF_RESET:
+                self._reset()
+            elif self._pointer < REGISTERS:
+                self._regs[self._pointer] = b
+                led = led or REG_RLED <= self._pointer <= REG_BLED
+            self._pointer += 1
+        if led:
+            self.leds.append(self.led)
+
+    def read(self, buf):
+        self.reads += 1
+        for i in range(len(buf)):
+            p = self._pointer
+            buf[i] = self._regs[p] if p < REGISTERS else 0
+            if p == REG_ESTATUS:
+                self._regs[p] = 0
+            self._pointer += 1
+
+    @property
+    def value(self):
+        return self._get_float(REG_CVAL)
+
+    @property
+    def led(self):
+        return self._regs[REG_RLED], self._regs[REG_GLED], self._regs[REG_BLED]
+
+    def rotate(self, steps):
+        value = self.value + steps * self._get_float(REG_ISTEP)
+        low = self._get_float(REG_CMIN)
+        high = self._get_float(REG_CMAX)
+        if value > high:
+            value = low if self._regs[REG_GCONF] & GCONF_WRAPE else high
+        elif value < low:
+            value = high if self._regs[REG_GCONF] & GCONF_WRAPE else low
+        self._set_float(REG_CVAL, value)
+        self._regs[REG_ESTATUS] |= ESTATUS_RINC if steps > 0 else ESTATUS_RDEC
+
+    def click(self, hold_ns=PRESS_NS):
+        self._regs[REG_GP1REG] = 0
+        self._world.clock.after(hold_ns, self._release)
+
+    def double_click(self):
+        self._regs[REG_ESTATUS] |= ESTATUS_PUSHD
+
+    # noinspection PyUnusedLocal
+    def _release(self, timestamp):
+        self._regs[REG_GP1REG] = 1
+
+    def _get_float(self, reg):
+        return struct.unpack_from(">f", self._regs, reg)[0]
+
+    def _set_float(self, reg, value):
+        struct.pack_into(">f", self._regs, reg, value)
+
+
+def _lock(i2c):
+    while not i2c.try_lock():
+        pass
+
+
+def _register(reg, fmt=">B"):
+    size = struct.calcsize(fmt)
+
+    def get(self):
+        buf = bytearray(size)
+        _lock(self._i2c)
+        try:
+            self._i2c.writeto_then_readfrom(self._address, bytes((reg,)), buf)
+        finally:
+            self._i2c.unlock()
+        return struct.unpack(fmt, buf)[0]
+
+    def set(self, value):
+        _lock(self._i2c)
+        try:
+            self._i2c.writeto(self._address, bytes((reg,)) + struct.pack(fmt, value))
+        finally:
+            self._i2c.unlock()
+    return property(get, set)
+
+
+def _bits(reg, shift, width=1):
+    field = _register(reg)
+    mask = ((1 << width) - 1) << shift
+
+    def get(self):
+        return (field.fget(self) & mask) >> shift
+
+    def set(self, value):
+        field.fset(self, (field.fget(self) & ~mask) | ((value << shift) & mask))
+    return property(get, set)
+
+
+# The driver, one bus transaction per register access as on the board
+class Encoder:
+
+    def __init__(self, i2c, address):
+        self._i2c = i2c
+        self._address = address
+
+    gconf_dtype = _bits(REG_GCONF, 0)
+    gconf_wrape = _bits(REG_GCONF, 1)
+    gconf_etype = _bits(REG_GCONF, 5)
+
+    @property
+    def gconf_rst(self):
+        return 0
+
+    @gconf_rst.setter
+    def gconf_rst(self, value):
+        if value:
+            Encoder._gconf.fset(self, GCONF_RESET)
+
+    _gconf = _register(REG_GCONF)
+
+    gp1conf_mode = _bits(REG_GP1CONF, 0, 2)
+    gp1conf_pul = _bits(REG_GP1CONF, 2)
+
+    estatus = _register(REG_ESTATUS)
+    cval_float = _register(REG_CVAL, ">f")
+    cmax_float = _register(REG_CMAX, ">f")
+    cmin_float = _register(REG_CMIN, ">f")
+    istep_float = _register(REG_ISTEP, ">f")
+    rled = _register(REG_RLED)
+    gled = _register(REG_GLED)
+    bled = _register(REG_BLED)
+    gp1 = _register(REG_GP1REG)
+    dpperiod = _register(REG_DPPERIOD)
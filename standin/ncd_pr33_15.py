@@ -0,0 +1,194 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Register-level stand-in for the NCD PR33-15 4-20mA receiver (an MCP3428 behind a 249 ohm shunt and a 5.45x
+# op-amp) and the ncd_pr33_15.receiver driver.
+
+ADDRESS = 0x68
+
+GAIN_1X = 0
+GAIN_2X = 1
+GAIN_4X = 2
+GAIN_8X = 3
+
+SAMPLE_RATE_12_BIT = 0
+SAMPLE_RATE_14_BIT = 1
+SAMPLE_RATE_16_BIT = 2
+
+CONFIG_RDY = 0x80
+CONFIG_CONTINUOUS = 0x10
+
+SHUNT_OHMS = 249
+OPAMP_GAIN = 5.45
+VREF = 2.048
+
+# Conversion period and full-scale code for each sample rate
+CONVERSION_NS = {
+    SAMPLE_RATE_12_BIT: 1000000000 // 240,
+    SAMPLE_RATE_14_BIT: 1000000000 // 60,
+    SAMPLE_RATE_16_BIT: 1000000000 // 15,
+}
+FULL_SCALE = {
+    SAMPLE_RATE_12_BIT: 2047,
+    SAMPLE_RATE_14_BIT: 8191,
+    SAMPLE_RATE_16_BIT: 32767,
+}
+
+
+# The receiver board. A configuration byte written by the master selects the channel, mode, sample rate and gain and
+# restarts conversion. In continuous mode a new conversion completes every conversion period. Reading returns the
+# last completed conversion as a big-endian 16-bit code followed by the configuration byte, whose RDY bit is clear
+# while the result is new. Until the first conversion after a channel switch completes, the previous channel's
+# result is returned.
+class ReceiverDevice:
+
+    MAX_FREQUENCY = 400000  # datasheet fast mode, the MCP3428's high-speed mode is not modelled
+
+    def __init__(self, world, address=ADDRESS, noise=0.5):
+        self._world = world
+        self._address = address
+        self._noise = noise  # standard deviation of the conversion noise, in codes
+        self._config = CONFIG_CONTINUOUS
+        self._started = 0
+        self._converted = 0  # conversions completed since _started
+        self._code = 0
+        self._new = False
+        self.writes = 0
+        self.reads = 0
+        self.conversions = 0
+
+    def write(self, data):
+        self.writes += 1
+        if data:
+            self._convert(self._world.clock.monotonic_ns())
+            self._config = data[-1] & 0x7F
+            self._started = self._world.clock.monotonic_ns()
+            self._converted = 0
+
+    def read(self, buf):
+        self.reads += 1
+        self._convert(self._world.clock.monotonic_ns())
+        code = self._code & 0xFFFF
+        if len(buf) > 0:
+            buf[0] = code >> 8
+        if len(buf) > 1:
+            buf[1] = code & 0xFF
+        if len(buf) > 2:
+            buf[2] = self._config | (0 if self._new else CONFIG_RDY)
+        self._new = False
+
+    def _convert(self, timestamp):
+        sample_rate = (self._config >> 2) & 0x03
+        period = CONVERSION_NS[sample_rate]
+        done = (timestamp - self._started) // period
+        if not self._config & CONFIG_CONTINUOUS and done > 1:
+            done = 1
+        if done > self._converted:
+            # Only the newest of any conversions completed since the last look is visible
+            self._converted = done
+            self._code = self._sample(self._started + done * period, sample_rate)
+            self._new = True
+            self.conversions += 1
+
+    def _sample(self, timestamp, sample_rate):
+        ch = (self._config >> 5) & 0x03
+        gain = 1 << (self._config & 0x03)
+        volts = self._world.current(self._address, ch, timestamp) * SHUNT_OHMS / OPAMP_GAIN
+        full_scale = FULL_SCALE[sample_rate]
+        code = int(volts / (VREF / gain) * full_scale + self._world.rng.gauss(0, self._noise) + 0.5)
+        if code > full_scale:
+            code = full_scale
+        elif code < -full_scale - 1:
+            code = -full_scale - 1
+        return code
+
+
+# The driver. Each configuration change is one single-byte write and each reading a three byte read.
+class Receiver:
+
+    def __init__(self, i2c, address=ADDRESS):
+        self._i2c = i2c
+        self._address = address
+        self._channel = 0
+        self._gain = GAIN_1X
+        self._sample_rate = SAMPLE_RATE_12_BIT
+        self._continuous = True
+        self._buf = bytearray(3)
+
+    @property
+    def channel(self):
+        return self._channel
+
+    @channel.setter
+    def channel(self, channel):
+        self._channel = channel
+        self._configure()
+
+    @property
+    def gain(self):
+        return self._gain
+
+    @gain.setter
+    def gain(self, gain):
+        self._gain = gain
+        self._configure()
+
+    @property
+    def sample_rate(self):
+        return self._sample_rate
+
+    @sample_rate.setter
+    def sample_rate(self, sample_rate):
+        self._sample_rate = sample_rate
+        self._configure()
+
+    @property
+    def continuous(self):
+        return self._continuous
+
+    @continuous.setter
+    def continuous(self, continuous):
+        self._continuous = continuous
+        self._configure()
+
+    def raw_value(self):
+        while not self._i2c.try_lock():
+            pass
+        try:
+            self._i2c.readfrom_into(self._address, self._buf)
+        finally:
+            self._i2c.unlock()
+        code = (self._buf[0] << 8) | self._buf[1]
+        return code - 0x10000 if code & 0x8000 else code
+
+    def _configure(self):
+        config = CONFIG_RDY | (self._channel << 5) | (self._sample_rate << 2) | self._gain
+        if self._continuous:
+            config |= CONFIG_CONTINUOUS
+        while not self._i2c.try_lock():
+            pass
+        try:
+            self._i2c.writeto(self._address, bytes((config,)))
+        finally:
+            self._i2c.unlock()
@@ -0,0 +1,51 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Stand-in for usb_cdc. install() enables the data channel when the world has somewhere to send it, e.g. a file
+# opened for binary writing.
+
+console = None
+data = None
+
+
+class Serial:
+
+    connected = True
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytes = 0
+
+    def write(self, buf):
+        self._stream.write(bytes(buf))
+        self.bytes += len(buf)
+        return len(buf)
+
+    def flush(self):
+        self._stream.flush()
+
+
+def _enable(world_):
+    global data
+    data = Serial(world_.usb_data) if world_.usb_data is not None else None
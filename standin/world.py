@@ -0,0 +1,167 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import random
+
+from .clock import VirtualClock
+
+# The world the stand-in peripherals live in: the virtual clock, the I2C devices on the bus, the GPIO pin levels, the
+# NVM contents and the pour stations whose flow the receiver measures. install() makes one current for the process.
+current = None
+
+FLOW_MIN = 0.9  # L/min at 4mA
+FLOW_MAX = 15.0  # L/min at 20mA
+TEMP_MIN = -25.0  # C at 4mA
+TEMP_MAX = 125.0  # C at 20mA
+
+NVM_SIZE = 8192
+RECEIVER = 0x68
+
+
+# One pour station: a valve on a GPIO pin feeding a flow sensor and a temperature sensor on two receiver channels.
+#
+# The flow follows the valve after a fixed opening or closing latency and is integrated exactly, so the litres
+# actually poured can be compared with what the controller believes it poured.
+class Station:
+
+    OPEN_LATENCY_NS = 30000000
+    CLOSE_LATENCY_NS = 60000000
+
+    def __init__(self, world, valve_pin, flow_ch, temp_ch, receiver=RECEIVER, flow_rate=6.0, temp=18.0, noise=0.02,
+                 open_latency_ns=OPEN_LATENCY_NS, close_latency_ns=CLOSE_LATENCY_NS):
+        self._world = world
+        self.valve_pin = valve_pin
+        self.receiver = receiver  # I2C address of the receiver the sensors are wired to
+        self.flow_ch = flow_ch
+        self.temp_ch = temp_ch
+        self.flow_rate = flow_rate  # L/min while the valve is open
+        self.temp = temp  # C
+        self.noise = noise  # standard deviation, as a fraction of the reading
+        self.open_latency_ns = open_latency_ns
+        self.close_latency_ns = close_latency_ns
+
+        self.pours = 0
+        self._flowing = False
+        self._litres = 0.0
+        self._since = 0  # timestamp _litres is integrated up to
+
+    @property
+    def flowing(self):
+        return self._flowing
+
+    def litres(self, timestamp):
+        if self._flowing:
+            return self._litres + self.flow_rate * (timestamp - self._since) / 60000000000
+        return self._litres
+
+    def flow(self, timestamp):
+        if not self._flowing:
+            return 0.0
+        return self.flow_rate * (1 + self._world.rng.gauss(0, self.noise))
+
+    def valve_changed(self, timestamp, value):
+        latency = self.open_latency_ns if value else self.close_latency_ns
+        self._world.clock.at(timestamp + latency, lambda ts: self._set_flowing(ts, value))
+
+    def _set_flowing(self, timestamp, flowing):
+        self._litres = self.litres(timestamp)
+        self._since = timestamp
+        if flowing and not self._flowing:
+            self.pours += 1
+        self._flowing = flowing
+
+
+class World:
+
+    def __init__(self, clock=None, seed=0):
+        self.clock = clock if clock is not None else VirtualClock()
+        self.rng = random.Random(seed)
+        self.devices = {}  # I2C address -> device model
+        self.pins = {}  # pin -> output level
+        self.stations = []
+        self.nvm = bytearray(b"\xff" * NVM_SIZE)
+        self.usb_data = None  # where the usb_cdc data channel goes, None if it is not enabled
+        self.buses = []
+        self.uarts = []
+
+    def add_device(self, address, device):
+        self.devices[address] = device
+        return device
+
+    def add_station(self, valve_pin, flow_ch, temp_ch, **kwargs):
+        station = Station(self, valve_pin, flow_ch, temp_ch, **kwargs)
+        self.stations.append(station)
+        return station
+
+    def pin_changed(self, pin, value):
+        if self.pins.get(pin) == value:
+            return
+        self.pins[pin] = value
+        for station in self.stations:
+            if station.valve_pin == pin:
+                station.valve_changed(self.clock.monotonic_ns(), value)
+
+    # The loop current on a receiver channel, in amps
+    def current(self, receiver, ch, timestamp):
+        for station in self.stations:
+            if station.receiver != receiver:
+                continue
+            if station.flow_ch == ch:
+                return _loop_current(station.flow(timestamp), FLOW_MIN, FLOW_MAX)
+            if station.temp_ch == ch:
+                temp = station.temp * (1 + self.rng.gauss(0, station.noise / 10))
+                return _loop_current(temp, TEMP_MIN, TEMP_MAX)
+        return 0.0
+
+
+def _loop_current(value, low, high):
+    ma = 4 + 16 * (value - low) / (high - low)
+    if ma < 4:
+        ma = 4
+    elif ma > 20:
+        ma = 20
+    return ma / 1000
+
+
+# The dispenser as wired in app.py: encoders at 0x78 and 0x70, the receiver at 0x68 and valves on D2 and D3
+# with the flow and temperature sensors on channels 1/2 and 3/4.
+DEFAULT_STATIONS = (
+    (0x78, "D2", RECEIVER, 0, 1),
+    (0x70, "D3", RECEIVER, 2, 3),
+)
+
+
+# A world with an encoder, a valve and a pair of sensors for each (encoder address, valve pin, receiver address,
+# flow channel, temperature channel)
+def default_world(clock=None, seed=0, stations=DEFAULT_STATIONS):
+    from .i2c_encoder import EncoderDevice
+    from .ncd_pr33_15 import ReceiverDevice
+
+    world = World(clock, seed)
+    for enc_address, valve_pin, receiver, flow_ch, temp_ch in stations:
+        world.add_device(enc_address, EncoderDevice(world))
+        if receiver not in world.devices:
+            world.add_device(receiver, ReceiverDevice(world, receiver))
+        world.add_station(valve_pin, flow_ch, temp_ch, receiver=receiver)
+    return world
@@ -0,0 +1,121 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import time
+from array import array
+
+
+# Fixed-bucket latency histograms for the scheduler's tasks, one per station and stage. Whole tasks are wrapped by
+# measure(), the steps within a task are added as stages of their own and timed by the task with record().
+#
+# All storage is allocated when a stage is added, recording a call is a couple of monotonic_ns() reads and array
+# updates. Latencies are bucketed in units of 1024ns (about 1us) with two buckets per power of two, so percentiles are
+# accurate to within 50% while min and max are exact. The last bucket also collects everything slower. When stats
+# are disabled nothing is wrapped and there is no overhead at all.
+class LatencyStats:
+
+    BUCKETS = 48
+
+    def __init__(self):
+        self._names = []
+        self._hist = []
+        self._count = array('L')
+        self._min = array('L')
+        self._max = array('L')
+
+    # A stage that is timed by its owner and passed to record(), e.g. one step of a task
+    def add(self, name):
+        stage = len(self._names)
+        self._names.append(name)
+        self._hist.append(array('L', [0] * LatencyStats.BUCKETS))
+        self._count.append(0)
+        self._min.append(0xFFFFFFFF)
+        self._max.append(0)
+        return stage
+
+    def record(self, stage, ns):
+        self._hist[stage][LatencyStats._bucket(ns >> 10)] += 1
+        self._count[stage] += 1
+        if ns < self._min[stage]:
+            self._min[stage] = ns
+        if ns > self._max[stage]:
+            self._max[stage] = ns
+
+    def measure(self, name, callback):
+        stage = self.add(name)
+
+        def measured(timestamp):
+            start = time.monotonic_ns()
+            callback(timestamp)
+            self.record(stage, time.monotonic_ns() - start)
+
+        return measured
+
+    def reset(self):
+        for stage in range(len(self._names)):
+            hist = self._hist[stage]
+            for i in range(LatencyStats.BUCKETS):
+                hist[i] = 0
+            self._count[stage] = 0
+            self._min[stage] = 0xFFFFFFFF
+            self._max[stage] = 0
+
+    # The upper edge of the bucket holding the p'th percentile, clamped to the observed min and max
+    def percentile(self, stage, p):
+        target = (self._count[stage] * p + 99) // 100
+        seen = 0
+        hist = self._hist[stage]
+        for i in range(LatencyStats.BUCKETS):
+            seen += hist[i]
+            if seen >= target:
+                return max(self._min[stage], min(LatencyStats._upper(i) << 10, self._max[stage]))
+        return self._max[stage]
+
+    # Values 0 and 1 have buckets of their own, then each [2^(n-1), 2^n) is split in two on its second highest bit
+    @staticmethod
+    def _bucket(value):
+        if value < 2:
+            return value
+        length = 0
+        v = value
+        while v:
+            v >>= 1
+            length += 1
+        bucket = 2 * (length - 1) + ((value >> (length - 2)) & 1)
+        return bucket if bucket < LatencyStats.BUCKETS else LatencyStats.BUCKETS - 1
+
+    @staticmethod
+    def _upper(bucket):
+        if bucket < 2:
+            return bucket + 1
+        return (3 + (bucket & 1)) << (bucket // 2 - 1)
+
+    def report(self):
+        print("{:20} {:>8} {:>8} {:>8} {:>8} {:>8}".format("stage (us)", "count", "min", "p50", "p99", "max"))
+        for stage, name in enumerate(self._names):
+            if self._count[stage] == 0:
+                continue
+            print("{:20} {:8d} {:8d} {:8d} {:8d} {:8d}".format(
+                name, self._count[stage], self._min[stage] // 1000, self.percentile(stage, 50) // 1000,
+                self.percentile(stage, 99) // 1000, self._max[stage] // 1000))
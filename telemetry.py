@@ -0,0 +1,75 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import struct
+
+
+# Streams fixed-size binary frames describing each station, in place of formatted prints.
+#
+# A frame is a sync byte, then the timestamp in us (uint32, wrapping every ~71 minutes), the station (uint8), flags
+# (uint8, bit 0 set while the valve is open), the controller events latched since the last frame (uint8), the raw
+# flow code (int16), the filtered flow in L/min and the temperature in C (float32), and the remaining volume in uL
+# (int32), little-endian. Frames are packed in place into one preallocated buffer and sent in a single write when
+# flushed or full.
+#
+# Like Capture, the stream is normally usb_cdc.data, and frames are dropped while no host is connected. A decoder
+# joining part way through finds the frame boundaries from the sync bytes.
+class Telemetry:
+
+    SYNC = 0xA5
+    FRAME = "<BIBBBhffi"
+    FRAME_SIZE = struct.calcsize(FRAME)
+    FRAMES = 16
+
+    FLAG_OPEN = 0x01
+
+    def __init__(self, stream, frames=FRAMES):
+        self._stream = stream
+        self._buf = bytearray(Telemetry.FRAME_SIZE * frames)
+        self._view = memoryview(self._buf)
+        self._n = 0
+        self.frames = 0
+        self.dropped = 0
+
+    def frame(self, timestamp, station, controller):
+        if self._n == len(self._buf):
+            self._write()
+        struct.pack_into(Telemetry.FRAME, self._buf, self._n, Telemetry.SYNC, (timestamp // 1000) & 0xFFFFFFFF,
+                         station, Telemetry.FLAG_OPEN if controller.is_open else 0, controller.events,
+                         controller.raw_flow, controller.flow, controller.temperature, controller.microlitres)
+        self._n += Telemetry.FRAME_SIZE
+        self.frames += 1
+
+    # noinspection PyUnusedLocal
+    def flush(self, timestamp):
+        self._write()
+
+    def _write(self):
+        if not self._n:
+            return
+        if getattr(self._stream, "connected", True):
+            self._stream.write(self._view[:self._n])
+        else:
+            self.dropped += self._n // Telemetry.FRAME_SIZE
+        self._n = 0
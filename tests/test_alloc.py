@@ -0,0 +1,105 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import standin
+from standin.alloc import AllocationCounter, LongInt
+
+import busio
+from board import SCL, SDA, TX, RX
+
+from app import App, I2C_FREQUENCY, REFRESH_FREQ
+from scheduler import Scheduler
+
+# Heap allocation in the steady-state controller tick, counted the way MicroPython would make them by the stand-in's
+# AllocationCounter. tracemalloc cannot show it: CPython allocates every int past 256 and keeps free lists, and its
+# peak did not move with a str.format or a list added to the tick. GCMonitor measures the real figure on hardware.
+
+WARM_NS = 2000000000
+TICKS = 1000
+
+
+def dispensing_controller():
+    world = standin.install(standin.default_world())
+    clock = world.clock
+    app = App(busio.I2C(SCL, SDA, frequency=I2C_FREQUENCY), busio.UART(TX, RX, baudrate=115200))
+    scheduler = Scheduler()
+    for name, callback, period, priority, offset in app.tasks():
+        scheduler.add(name, callback, period, priority, clock.monotonic_ns() + offset)
+
+    def run_for(ns):
+        end = clock.monotonic_ns() + ns
+        while clock.monotonic_ns() < end:
+            scheduler.run_next()
+
+    # Start a long pour and let the flow come up
+    encoder = world.devices[0x78]
+    encoder.rotate(40)
+    run_for(WARM_NS // 4)
+    encoder.click()
+    run_for(WARM_NS)
+    ctlr = app.controllers[0]
+    assert ctlr.is_open and ctlr.flow > 0
+    return clock, ctlr
+
+
+# Hold the sensor reading by ticking the controller alone, and count what every tick allocates
+def steady_ticks(clock, tick, n=TICKS, also=()):
+    counter = AllocationCounter(also)
+    for _ in range(n):
+        clock.advance(REFRESH_FREQ)
+        counter.run(tick, LongInt(clock.monotonic_ns()))
+    return counter
+
+
+# A tick of a controller dispensing at a steady flow allocates nothing but the one long int of the timestamp gap, which
+# the integrator brings straight back to a small int
+def test_steady_tick_allocation():
+    clock, ctlr = dispensing_controller()
+    counter = steady_ticks(clock, ctlr.tick)
+    assert ctlr.is_open
+    made = {(path, what): n for (path, line, what), n in counter.sites.items()}
+    assert made == {("integrator.py", "long int arithmetic"): TICKS}, counter.sites
+
+
+# The counter sees the allocations it is there to catch
+def test_allocations_are_counted():
+    clock, ctlr = dispensing_controller()
+    tick = ctlr.tick
+
+    def formatting(timestamp):
+        tick(timestamp)
+        "{:.2f}".format(ctlr.flow)
+
+    def building(timestamp):
+        tick(timestamp)
+        return [timestamp]
+
+    def long_ints(timestamp):
+        tick(timestamp)
+        return ctlr.microlitres * 1000000
+
+    # Each tick makes the gap's long int and at least one more
+    for callback in (formatting, building, long_ints):
+        counter = steady_ticks(clock, callback, 10, (callback.__code__,))
+        assert counter.total() >= 20, (callback.__name__, counter.sites)
@@ -0,0 +1,65 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import standin
+
+import busio
+from board import SCL, SDA, TX, RX
+
+from app import App, I2C_FREQUENCY
+from encoder import Encoder
+from scheduler import Scheduler
+
+# Bus manager checks against the stand-in encoders.
+
+SIM_NS = 1000000000
+
+
+def start_app():
+    world = standin.install(standin.default_world())
+    app = App(busio.I2C(SCL, SDA, frequency=I2C_FREQUENCY), busio.UART(TX, RX, baudrate=115200))
+    return world, app
+
+
+def run(world, app, ns):
+    scheduler = Scheduler()
+    start = world.clock.monotonic_ns()
+    for name, callback, period, priority, offset in app.tasks():
+        scheduler.add(name, callback, period, priority, start + offset)
+    while world.clock.monotonic_ns() < start + ns:
+        scheduler.run_next()
+
+
+# Every encoder shows amber whilst the app sets up, and only goes green once it is ready
+def test_setup_shows_amber():
+    world, app = start_app()
+    assert app.bus.merged == 0
+    for enc in app.encoders:
+        device = world.devices[enc._address]
+        assert device.leds[-1] == Encoder.LED_RGB[Encoder.LED_AMBER], device.leds
+    run(world, app, SIM_NS)
+    for enc in app.encoders:
+        device = world.devices[enc._address]
+        colours = [rgb for rgb in device.leds if rgb != (0, 0, 0)]
+        assert colours == [Encoder.LED_RGB[Encoder.LED_AMBER], Encoder.LED_RGB[Encoder.LED_GREEN]], device.leds
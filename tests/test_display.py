@@ -0,0 +1,183 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import time
+
+import standin
+
+import busio
+from board import TX, RX
+
+from app import DISPLAY_MAX_WRITE, REFRESH_FREQ
+from gauge import Gauge
+from nextion import CommandBuffer
+from scheduler import Scheduler
+
+# Display jitter on the stand-in UART and virtual clock. The UART advances the clock by the time each write takes to
+# go out, so the clock's movement across a flush is exactly how long that flush blocked the tasks behind it. A
+# controller task at the controllers' rate records how late each of its ticks ran, for the dial refresh as it is and
+# as it was before the ref_star was deferred.
+
+BAUDRATE = 115200
+BITS_PER_BYTE = 10
+SIM_SECS = 20
+SETTLE_SECS = Gauge.PANEL_SETTLE_NS / 1000000000
+
+
+# Blocking time of a write of n bytes, in ns
+def write_ns(n):
+    return n * BITS_PER_BYTE * 1000000000 // BAUDRATE
+
+
+# The dial refresh before the ref_star was deferred: everything is flushed and the panel's settle time slept out after
+# the ref and again after the ref_star, with every other task waiting behind it
+class BlockingDialGauge(Gauge):
+
+    def refresh_dial(self, timestamp):
+        if self._dial_refresh:
+            self._display.command(b"ref_stop")
+            self._display.put(self._dial_pic)
+            self._display.put_int(self._dial)
+            self._display.end()
+            self._display.command(self._flow_ref)
+            self._display.flush(timestamp)
+            time.sleep(SETTLE_SECS)
+            self._display.command(b"ref_star")
+            self._display.flush(timestamp)
+            time.sleep(SETTLE_SECS)
+            self._dial_refresh = False
+        self._refresh_flow()
+
+
+class DisplayRun:
+
+    def __init__(self, stations, max_write=DISPLAY_MAX_WRITE, stagger=True, gauge=Gauge):
+        self.world = standin.install(standin.default_world())
+        self.clock = self.world.clock
+        self.uart = busio.UART(TX, RX, baudrate=BAUDRATE)
+        self.display = CommandBuffer(self.uart, max_write=max_write)
+        self.gauges = [gauge(self.display, "p{}".format(i), "vol{}".format(i), "flow{}".format(i), "tmp{}".format(i))
+                       for i in range(stations)]
+        self.stagger = stagger
+        self.flushes = 0
+        self.max_flush_ns = 0
+        self.lateness = []  # ns, of every controller tick
+        self._due = 0
+
+    def flush(self, timestamp):
+        start = self.clock.monotonic_ns()
+        self.display.flush(timestamp)
+        blocked = self.clock.monotonic_ns() - start
+        self.flushes += 1
+        if blocked > self.max_flush_ns:
+            self.max_flush_ns = blocked
+
+    # Stands in for the controllers, only recording how late each tick ran
+    def controller(self, timestamp):
+        self.lateness.append(timestamp - self._due)
+        self._due += REFRESH_FREQ
+        if self._due <= timestamp:
+            self._due += ((timestamp - self._due) // REFRESH_FREQ + 1) * REFRESH_FREQ
+
+    # p99 and max controller tick lateness, in ns
+    def late(self):
+        lateness = sorted(self.lateness)
+        return lateness[(len(lateness) * 99 + 99) // 100 - 1], lateness[-1]
+
+    # Every gauge's flow sweeps across the dial steps together, so the dials keep refreshing
+    def values(self, timestamp):
+        step = timestamp // Gauge.DIAL_FLOW_REFRESH_FREQ
+        for i, gauge in enumerate(self.gauges):
+            gauge.flow = 1.0 + (step % 20) / 2
+            gauge.vol = 2.0 - (timestamp // 1000000 % 2000) / 1000
+            gauge.temp = 18.0 + i
+
+    def run(self, sim_secs=SIM_SECS):
+        n = len(self.gauges)
+        start = self.clock.monotonic_ns()
+        scheduler = Scheduler()
+        self._due = start
+        scheduler.add("controller", self.controller, REFRESH_FREQ, 0, start)
+        scheduler.add("values", self.values, REFRESH_FREQ, 0, start)
+        for i, gauge in enumerate(self.gauges):
+            text = Gauge.MODE_VOL_TEMP_REFRESH_FREQ * i // n if self.stagger else 0
+            dial = Gauge.DIAL_FLOW_REFRESH_FREQ * i // n if self.stagger else 0
+            scheduler.add("text {}".format(i), gauge.refresh_text, Gauge.MODE_VOL_TEMP_REFRESH_FREQ, 1, start + text)
+            scheduler.add("dial {}".format(i), gauge.refresh_dial, Gauge.DIAL_FLOW_REFRESH_FREQ, 1, start + dial)
+        scheduler.add("display", self.flush, REFRESH_FREQ, 2, start)
+        end = start + sim_secs * 1000000000
+        while self.clock.monotonic_ns() < end:
+            scheduler.run_next()
+        return self
+
+
+# No flush blocks for longer than max_write bytes take to send, however many stations share the display, and that
+# fits inside one controller tick
+def test_flush_blocking_is_bounded():
+    assert write_ns(DISPLAY_MAX_WRITE) < REFRESH_FREQ
+    for stations in (1, 2, 4, 8):
+        run = DisplayRun(stations).run()
+        assert run.flushes > 0
+        assert run.uart.bytes > 0
+        assert run.max_flush_ns <= write_ns(DISPLAY_MAX_WRITE), (stations, run.max_flush_ns)
+
+
+# Commands queued faster than max_write lets them out fill the buffer, which must not force it all out in one write
+def test_overflow_blocking_is_bounded():
+    clock = standin.install(standin.default_world()).clock
+    uart = busio.UART(TX, RX, baudrate=BAUDRATE)
+    display = CommandBuffer(uart, size=64, max_write=16)
+    for i in range(100):
+        command = "vol0.txt=\"{:.2f}\"".format(i / 100).encode()
+        start = clock.monotonic_ns()
+        display.command(command)
+        blocked = clock.monotonic_ns() - start
+        assert blocked <= write_ns(len(command) + len(CommandBuffer.TERMINATOR)), blocked
+        if i % 4 == 0:
+            start = clock.monotonic_ns()
+            display.flush(0)
+            assert clock.monotonic_ns() - start <= write_ns(16)
+    for _ in range(100):
+        display.flush(0)
+    assert uart.panel.attributes["vol0.txt"] == "\"0.99\""
+
+
+# Dials that refresh together queue one ref_star between them, staggered dials never have one waiting
+def test_deferred_commands_coalesce():
+    run = DisplayRun(4, stagger=False).run()
+    assert run.display.coalesced > 0
+    assert run.display.deferred <= 1
+
+    run = DisplayRun(4, stagger=True).run()
+    assert run.display.coalesced == 0
+
+
+# Sleeping out the panel's settle time held every controller tick behind a dial refresh up for both settle periods;
+# deferring the ref_star leaves every flush finished before the next tick is due, so no tick is ever held up by it
+def test_controller_jitter():
+    for stations in (1, 2, 4, 8):
+        before = DisplayRun(stations, max_write=None, gauge=BlockingDialGauge).run()
+        after = DisplayRun(stations).run()
+        assert before.late()[1] >= 2 * Gauge.PANEL_SETTLE_NS, (stations, before.late())
+        assert after.late()[1] <= REFRESH_FREQ - write_ns(DISPLAY_MAX_WRITE), (stations, after.late())
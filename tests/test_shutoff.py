@@ -0,0 +1,104 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import standin
+
+import busio
+from board import SCL, SDA, TX, RX
+
+from app import App, I2C_FREQUENCY
+from scheduler import Scheduler
+from shutoff import ShutoffPredictor
+
+# Shutoff learning against the stand-in valve's run-on. The app's first station pours the same volume over and over
+# from an unlearned latency, and each pour is checked against the litres the stand-in actually delivered rather than
+# what the sensor measured.
+
+STEP = 0.25  # litres per encoder detent
+STEPS = 4
+POURS = 12
+SETTLE_NS = 3000000000  # after a pour's volume has gone out, for the run-on and the sensor's window to clear
+WARM_NS = 2000000000
+CONVERGED_UL = 3000  # the most any of the last few pours may miss by
+CONVERGED_POURS = 4
+
+
+class ShutoffRun:
+
+    def __init__(self, world=None):
+        self.world = standin.install(world or standin.default_world())
+        self.clock = self.world.clock
+        self.station = self.world.stations[0]
+        self.encoder = self.world.devices[0x78]
+        self.app = App(busio.I2C(SCL, SDA, frequency=I2C_FREQUENCY), busio.UART(TX, RX, baudrate=115200))
+        self.controller = self.app.controllers[0]
+        self.scheduler = Scheduler()
+        start = self.clock.monotonic_ns()
+        for name, callback, period, priority, offset in self.app.tasks():
+            self.scheduler.add(name, callback, period, priority, start + offset)
+        self.errors = []  # microlitres delivered past the target by each pour
+        self.run_for(WARM_NS)
+
+    def run_for(self, ns):
+        end = self.clock.monotonic_ns() + ns
+        while self.clock.monotonic_ns() < end:
+            self.scheduler.run_next()
+
+    def pour(self, steps=STEPS):
+        self.encoder.rotate(steps)
+        self.run_for(500000000)
+        before = self.station.litres(self.clock.monotonic_ns())
+        self.encoder.click()
+        self.run_for(int(steps * STEP / self.station.flow_rate * 60 * 1000000000) + SETTLE_NS)
+        delivered = self.station.litres(self.clock.monotonic_ns()) - before
+        self.errors.append(int((delivered - steps * STEP) * 1000000))
+        assert self.controller.microlitres == 0, (len(self.errors), self.controller.microlitres)
+        return self
+
+    def pours(self, n=POURS):
+        for _ in range(n):
+            self.pour()
+        return self
+
+
+# Closing on the volume overshoots by the run-on, and learning the latency takes the overshoot out of the true volume
+def test_overshoot_converges():
+    run = ShutoffRun()
+    run.controller.shutoff_latency_ns = 0
+    run.pours()
+    assert run.errors[0] > 10 * CONVERGED_UL, run.errors
+    assert all(abs(error) <= CONVERGED_UL for error in run.errors[-CONVERGED_POURS:]), run.errors
+    assert 0 < run.controller.shutoff_latency_ns < ShutoffPredictor.MAX_LATENCY_NS
+
+
+# The learned latency is journalled with the volumes, so the first pour after a restart already lands on the volume
+def test_latency_survives_restart():
+    run = ShutoffRun().pours()
+    latency = run.controller.shutoff_latency_ns
+    run.app.save_state(run.clock.monotonic_ns())
+
+    restarted = ShutoffRun(run.world)
+    assert restarted.controller.shutoff_latency_ns == latency
+    restarted.pour()
+    assert abs(restarted.errors[0]) <= CONVERGED_UL, restarted.errors
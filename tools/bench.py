@@ -0,0 +1,388 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TOOLS, ".."))
+
+import standin  # noqa: E402
+
+standin.install()
+
+import busio  # noqa: E402
+from board import SCL, SDA, TX, RX  # noqa: E402
+
+from app import App, REFRESH_FREQ  # noqa: E402
+from adc import ReceiverScheduler  # noqa: E402
+from encoder import Encoder  # noqa: E402
+from gauge import Gauge  # noqa: E402
+from nextion import CommandBuffer  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+from sensor import Sensor  # noqa: E402
+from filters import SGFilter, EMAFilter, MedianFilter, PassThroughFilter  # noqa: E402
+from valve import Valve  # noqa: E402
+import mock_sensor  # noqa: E402
+
+from simulate import Operator  # noqa: E402
+
+# Benchmarks for the hot paths, run on the stand-in hardware.
+#
+# Each benchmark sets up the objects under test in a fresh world and runs them as scheduler tasks at their real
+# periods for a stretch of simulated time. Only the calls under test are timed, giving ops/sec, while the bus
+# counters give I2C transactions and UART bytes per simulated second. Results are written as JSON and compared with
+# the stored baseline: bus traffic is deterministic and is held to a tight tolerance, speed depends on the machine
+# and gets a loose one. Tasks can also be tracked for how late each run starts against its deadline on the deadline
+# scheduler of code.py. The boot benchmarks report simulated milliseconds to the first controller tick instead.
+
+SEED = 1
+BASELINE = os.path.join(TOOLS, "bench_baseline.json")
+
+# metric -> True if higher is better
+METRICS = {
+    "ops_per_sec": True,
+    "i2c_per_sim_sec": False,
+    "i2c_bytes_per_sim_sec": False,
+    "uart_bytes_per_sim_sec": False,
+    "late_p99_us": False,
+    "late_max_us": False,
+    "boot_ms": False,
+    "warm_ms": False,
+}
+SPEED_TOLERANCE = 0.5
+TRAFFIC_TOLERANCE = 0.1
+
+
+class Bench:
+
+    def __init__(self, sim_secs):
+        self.world = standin.install(standin.default_world(seed=SEED))
+        self.sim_secs = sim_secs
+        self.tasks = []
+        self.ops = 0
+        self.elapsed_ns = 0
+        self.lateness = []  # ns, of every run of a tracked task
+
+    def i2c(self):
+        return busio.I2C(SCL, SDA, frequency=100000)
+
+    def uart(self):
+        return busio.UART(TX, RX, baudrate=115200)
+
+    def task(self, name, callback, period, priority=0, timed=False, offset=0, tracked=False):
+        if timed:
+            callback = self._timed(callback)
+        self.tasks.append((name, callback, period, priority, offset, tracked))
+
+    def _timed(self, callback):
+        def run(timestamp):
+            t = time.perf_counter_ns()
+            callback(timestamp)
+            self.elapsed_ns += time.perf_counter_ns() - t
+            self.ops += 1
+        return run
+
+    # The deadline moves on a period at a time, skipping any periods overrun, as in Task.run
+    def _tracked(self, callback, period, deadline):
+        due = [deadline]
+
+        def run(timestamp):
+            self.lateness.append(timestamp - due[0])
+            callback(timestamp)
+            due[0] += period
+            if due[0] <= timestamp:
+                due[0] += ((timestamp - due[0]) // period + 1) * period
+        return run
+
+    def run(self):
+        clock = self.world.clock
+        i2c_start = [(bus.transactions, bus.bytes) for bus in self.world.buses]
+        uart_start = [uart.bytes for uart in self.world.uarts]
+
+        start = clock.monotonic_ns()
+        end = start + int(self.sim_secs * 1000000000)
+        scheduler = Scheduler()
+        for name, callback, period, priority, offset, tracked in self.tasks:
+            if tracked:
+                callback = self._tracked(callback, period, start + offset)
+            scheduler.add(name, callback, period, priority, start + offset)
+        while clock.monotonic_ns() < end:
+            scheduler.run_next()
+
+        secs = (clock.monotonic_ns() - start) / 1000000000
+        transactions = sum(bus.transactions - t for bus, (t, _) in zip(self.world.buses, i2c_start))
+        i2c_bytes = sum(bus.bytes - b for bus, (_, b) in zip(self.world.buses, i2c_start))
+        uart_bytes = sum(uart.bytes - b for uart, b in zip(self.world.uarts, uart_start))
+        result = {
+            "ops": self.ops,
+            "ns_per_op": self.elapsed_ns // self.ops if self.ops else 0,
+            "ops_per_sec": round(self.ops * 1000000000 / self.elapsed_ns) if self.elapsed_ns else 0,
+            "sim_secs": round(secs, 3),
+            "i2c_per_sim_sec": round(transactions / secs, 2),
+            "i2c_bytes_per_sim_sec": round(i2c_bytes / secs, 2),
+            "uart_bytes_per_sim_sec": round(uart_bytes / secs, 2),
+        }
+        if self.lateness:
+            lateness = sorted(self.lateness)
+            result["late_p99_us"] = lateness[(len(lateness) * 99 + 99) // 100 - 1] // 1000
+            result["late_max_us"] = lateness[-1] // 1000
+        return result
+
+
+# Sensor.tick with the SG filtering of both channels, fed by the receiver while a valve is open
+def bench_sensor(sim_secs, flow_filter=None, temp_filter=None):
+    bench = Bench(sim_secs)
+    adc = ReceiverScheduler(bench.i2c(), Sensor.SAMPLE_RATE)
+    sensor = Sensor(adc, Sensor.CH_1, Sensor.CH_2, flow_filter=flow_filter, temp_filter=temp_filter)
+    Valve("D2").open()
+    bench.task("adc", adc.tick, adc.period, 0)
+    bench.task("sensor", sensor.tick, adc.period, 1, timed=True)
+    return bench.run()
+
+
+# Sensor.tick as above with both channels given the same filter engine instead
+def bench_sensor_with(create_filter):
+    def run(sim_secs):
+        return bench_sensor(sim_secs, create_filter(), create_filter())
+    return run
+
+
+# Gauge text and dial rendering plus the display flush, through a pour that counts down and repeats
+def bench_gauge(sim_secs):
+    bench = Bench(sim_secs)
+    display = CommandBuffer(bench.uart())
+    gauge = Gauge(display, "p0", "vol0", "flow0", "tmp0")
+    pour = {"vol": 0.0}
+
+    def values(timestamp):
+        if pour["vol"] <= 0:
+            pour["vol"] = 2.0
+        pour["vol"] -= 0.0001
+        gauge.vol = pour["vol"]
+        gauge.flow = 6.0 + (timestamp // 1000000 % 7) / 10
+        gauge.temp = 18.0 + (timestamp // 100000000 % 5) / 100
+
+    bench.task("values", values, 1000000, 0)
+    bench.task("gauge text", gauge.refresh_text, Gauge.MODE_VOL_TEMP_REFRESH_FREQ, 1, timed=True)
+    bench.task("gauge dial", gauge.refresh_dial, Gauge.DIAL_FLOW_REFRESH_FREQ, 1, timed=True)
+    bench.task("display", display.flush, 1000000, 2, timed=True)
+    return bench.run()
+
+
+# Encoder.tick register polling for both encoders, with the operator turning one every couple of seconds
+def bench_encoder(sim_secs):
+    bench = Bench(sim_secs)
+    i2c = bench.i2c()
+    encoders = [Encoder(i2c, 0x78), Encoder(i2c, 0x70)]
+    device = bench.world.devices[0x78]
+
+    def turn(timestamp):
+        device.rotate(1)
+        bench.world.clock.at(timestamp + 2000000000, turn)
+
+    bench.world.clock.after(1000000000, turn)
+    for i, enc in enumerate(encoders):
+        bench.task("encoder {}".format(i), enc.tick, Encoder.REFRESH_FREQ, 0, timed=True)
+    return bench.run()
+
+
+# Controller.tick end to end, with every task of the app running and an operator pouring on both stations
+def bench_controller(sim_secs):
+    bench = Bench(sim_secs)
+    app = App(bench.i2c(), bench.uart())
+    operator = Operator(bench.world, random.Random(SEED), 1.0, 2, 10)
+    for station, address in zip(bench.world.stations, (0x78, 0x70)):
+        operator.start(station, bench.world.devices[address])
+    timed = set(ctlr.tick for ctlr in app.controllers)
+    for name, callback, period, priority, offset in app.tasks():
+        bench.task(name, callback, period, priority, callback in timed, offset)
+    return bench.run()
+
+
+# Controller lateness against its deadlines on the scheduler, with every task of the app running and an operator
+# pouring on both stations
+def bench_runtime(sim_secs):
+    bench = Bench(sim_secs)
+    app = App(bench.i2c(), bench.uart())
+    operator = Operator(bench.world, random.Random(SEED), 1.0, 2, 10)
+    for station, address in zip(bench.world.stations, (0x78, 0x70)):
+        operator.start(station, bench.world.devices[address])
+    tracked = set(ctlr.tick for ctlr in app.controllers)
+    for name, callback, period, priority, offset in app.tasks():
+        bench.task(name, callback, period, priority, callback in tracked, offset, callback in tracked)
+    return bench.run()
+
+
+# The mock sensor's waveform generator and filter
+def bench_mock_sensor(sim_secs):
+    bench = Bench(sim_secs)
+    valve = Valve("D2")
+    valve.open()
+    sensor = mock_sensor.Sensor(10, 1, valve)
+    bench.task("mock sensor", sensor.tick, 1000000, 0, timed=True)
+    return bench.run()
+
+
+# Boot time on the virtual clock, from power-on to the first controller tick, and until every sensor window is full.
+# primed=True runs only the receivers and sensors until the windows are full before starting the main loop, as the
+# blocking Sensor._fill_buffer used to.
+# noinspection PyUnusedLocal
+def bench_boot(sim_secs, primed=False):
+    bench = Bench(0)
+    clock = bench.world.clock
+    start = clock.monotonic_ns()
+    app = App(bench.i2c(), bench.uart())
+    tasks = app.tasks()
+
+    def warming():
+        return any(sensor.warming for sensor in app.sensors)
+
+    if primed:
+        scheduler = Scheduler()
+        for name, callback, period, priority, offset in tasks:
+            if priority <= 1:
+                scheduler.add(name, callback, period, priority, clock.monotonic_ns() + offset)
+        while warming():
+            scheduler.run_next()
+
+    booted = []
+    warm = []
+
+    def controller(timestamp):
+        if not booted:
+            booted.append(timestamp)
+        if not warm and not warming():
+            warm.append(timestamp)
+
+    scheduler = Scheduler()
+    for name, callback, period, priority, offset in tasks:
+        scheduler.add(name, callback, period, priority, clock.monotonic_ns() + offset)
+    scheduler.add("boot", controller, REFRESH_FREQ, 3, clock.monotonic_ns())
+    while not warm:
+        scheduler.run_next()
+    return {
+        "boot_ms": round((booted[0] - start) / 1000000, 1),
+        "warm_ms": round((warm[0] - start) / 1000000, 1),
+    }
+
+
+BENCHMARKS = {
+    "sensor": bench_sensor,
+    "sensor_endpoint": bench_sensor_with(lambda: SGFilter.endpoint(31)),
+    "sensor_ema": bench_sensor_with(EMAFilter),
+    "sensor_median": bench_sensor_with(lambda: MedianFilter(9)),
+    "sensor_raw": bench_sensor_with(PassThroughFilter),
+    "gauge": bench_gauge,
+    "encoder": bench_encoder,
+    "controller": bench_controller,
+    "runtime_scheduler": bench_runtime,
+    "boot": bench_boot,
+    "boot_primed": lambda sim_secs: bench_boot(sim_secs, primed=True),
+    "mock_sensor": bench_mock_sensor,
+}
+
+
+def compare(results, baseline, speed_tolerance, traffic_tolerance):
+    failures = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric not in base:
+                continue
+            if higher_is_better:
+                limit = base[metric] * (1 - speed_tolerance)
+                if metrics[metric] < limit:
+                    failures.append((name, metric, metrics[metric], base[metric]))
+            else:
+                limit = base[metric] * (1 + traffic_tolerance) + 1
+                if metrics[metric] > limit:
+                    failures.append((name, metric, metrics[metric], base[metric]))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths on the stand-in hardware.")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, default all: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--sim-secs", type=float, default=30)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--speed-tolerance", type=float, default=SPEED_TOLERANCE)
+    parser.add_argument("--traffic-tolerance", type=float, default=TRAFFIC_TOLERANCE)
+    parser.add_argument("--quiet", action="store_true", help="discard the dispenser's own output")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.names or BENCHMARKS:
+        with open(os.devnull, "w") if args.quiet else contextlib.nullcontext(sys.stdout) as out:
+            with contextlib.redirect_stdout(out):
+                results[name] = BENCHMARKS[name](args.sim_secs)
+        metrics = results[name]
+        if "boot_ms" in metrics:
+            print("{:15} boot {:>7.1f} ms  sensors warm {:>7.1f} ms".format(name, metrics["boot_ms"], metrics["warm_ms"]))
+            continue
+        print("{:15} {:>9} ops/s {:>8} ns/op  i2c {:>7.1f}/s {:>8.1f} B/s  uart {:>7.1f} B/s".format(
+            name, metrics["ops_per_sec"], metrics["ns_per_op"], metrics["i2c_per_sim_sec"],
+            metrics["i2c_bytes_per_sim_sec"], metrics["uart_bytes_per_sim_sec"]))
+        if "late_max_us" in metrics:
+            print("{:15} controller lateness p99 {}us max {}us".format(
+                "", metrics["late_p99_us"], metrics["late_max_us"]))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("baseline updated: {}".format(args.baseline))
+        return
+
+    if not os.path.exists(args.baseline):
+        print("no baseline at {}, run with --update-baseline to store one".format(args.baseline))
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    failures = compare(results, baseline, args.speed_tolerance, args.traffic_tolerance)
+    for name, metric, value, base in failures:
+        print("REGRESSION {} {}: {} against baseline {}".format(name, metric, value, base))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
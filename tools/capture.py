@@ -0,0 +1,59 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import argparse
+import time
+
+# Records the raw receiver capture from the board's usb_cdc data channel to a file, until interrupted. Needs
+# pyserial. Set CAPTURE = True in app.py and enable the data channel in boot.py with
+# usb_cdc.enable(console=True, data=True). The board sends a fresh header when the port is opened.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record a raw receiver capture from the board's data port.")
+    parser.add_argument("port", help="the data port, e.g. /dev/ttyACM1")
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    try:
+        import serial
+    except ImportError:
+        raise SystemExit("Capturing needs pyserial (pip install pyserial).")
+
+    total = 0
+    started = time.monotonic()
+    with serial.Serial(args.port, timeout=1) as port, open(args.path, "wb") as f:
+        try:
+            while True:
+                data = port.read(4096)
+                if data:
+                    f.write(data)
+                    total += len(data)
+        except KeyboardInterrupt:
+            pass
+    print("{} bytes in {:.0f} secs".format(total, time.monotonic() - started))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from integrator import VolumeIntegrator  # noqa: E402
+from standin.alloc import AllocationCounter, Float, LongInt  # noqa: E402
+
+# Compares the fixed-point VolumeIntegrator with the float integration Controller used before it, against the exact
+# volume of an analytic flow profile. Ticks are nominally 1ms with random jitter. CircuitPython floats are single
+# precision, so the float integrator is also run with its running volume rounded to 32-bit floats.
+#
+# Time per update is measured on CPython, where float arithmetic is cheap and nothing here says much about the board.
+# What each update would cost under MicroPython is counted instead by the stand-in's AllocationCounter: heap
+# allocations, on ports with boxed floats and on those with immediate ones, and the bytecode ops executed.
+
+TICK_NS = 1000000
+JITTER_NS = 200000
+MEAN_FLOW = 6.0  # litres/min
+SWING_FLOW = 3.0
+PERIOD = 60.0  # secs
+ALLOCATION_UPDATES = 1000
+
+
+def flow_at(t):
+    return MEAN_FLOW + SWING_FLOW * math.sin(2 * math.pi * t / PERIOD)
+
+
+def volume_between(t0, t1):
+    # Integral of flow_at, converted from litres/min to litres
+    def f(t):
+        return MEAN_FLOW * t - SWING_FLOW * PERIOD / (2 * math.pi) * math.cos(2 * math.pi * t / PERIOD)
+    return (f(t1) - f(t0)) / 60
+
+
+def timestamps(hours, seed):
+    rng = random.Random(seed)
+    t = 0
+    end = int(hours * 3600 * 1000000000)
+    while t < end:
+        yield t
+        t += TICK_NS + rng.randint(-JITTER_NS, JITTER_NS)
+
+
+class FloatIntegrator:
+
+    # The integration Controller._update_state used before VolumeIntegrator
+    def __init__(self, single):
+        self._vol = array('f' if single else 'd', [0.0])
+        self._prev_timestamp = 0
+        self._prev_flow = 0
+
+    def update(self, timestamp, flow):
+        period = (timestamp - self._prev_timestamp) * pow(10, -9)
+        avg = (flow + self._prev_flow) / 120
+        self._vol[0] -= avg * period
+        self._prev_timestamp = timestamp
+        self._prev_flow = flow
+
+    @property
+    def volume(self):
+        return self._vol[0]
+
+
+def accuracy(hours, seed):
+    ints = VolumeIntegrator()
+    doubles = FloatIntegrator(False)
+    singles = FloatIntegrator(True)
+    start = None
+    t = 0
+    for timestamp in timestamps(hours, seed):
+        t = timestamp / 1000000000
+        flow = flow_at(t)
+        if start is None:
+            start = t
+            doubles._prev_timestamp = singles._prev_timestamp = timestamp
+            doubles._prev_flow = singles._prev_flow = flow
+        ints.update(timestamp, VolumeIntegrator.flow_ul(flow))
+        doubles.update(timestamp, flow)
+        singles.update(timestamp, flow)
+    exact = volume_between(start, t)
+    return exact, -ints.volume, -doubles.volume, -singles.volume
+
+
+def speed(n):
+    # Flow arrives as litres/min; the fixed-point integrator pays for the conversion at the boundary
+    flows = [flow_at(i / 1000) for i in range(1000)]
+    results = []
+
+    integrator = FloatIntegrator(False)
+    begin = time.perf_counter_ns()
+    timestamp = 0
+    for i in range(n):
+        timestamp += TICK_NS
+        integrator.update(timestamp, flows[i % 1000])
+    results.append(("float", (time.perf_counter_ns() - begin) / n))
+
+    integrator = VolumeIntegrator()
+    begin = time.perf_counter_ns()
+    timestamp = 0
+    for i in range(n):
+        timestamp += TICK_NS
+        integrator.update(timestamp, VolumeIntegrator.flow_ul(flows[i % 1000]))
+    results.append(("fixed-point", (time.perf_counter_ns() - begin) / n))
+    return results
+
+
+# Heap allocations and bytecode ops per update, from a timestamp already past 2^30 ns, as after a second of uptime
+def allocations(n, boxed_floats):
+    flows = [flow_at(i / 1000) for i in range(n)]
+    start = 10 * 1000000000
+    results = []
+
+    integrator = FloatIntegrator(False)
+    integrator._prev_timestamp = LongInt(start)
+    counter = AllocationCounter((FloatIntegrator.update.__code__,), boxed_floats)
+    for i in range(n):
+        counter.run(integrator.update, LongInt(start + (i + 1) * TICK_NS), Float(flows[i]))
+    results.append(("float", counter))
+
+    # The controller only converts the flow when it changes, so the update alone is a steady tick's cost
+    integrator = VolumeIntegrator()
+    integrator.update(LongInt(start), 0)
+    counter = AllocationCounter((), boxed_floats)
+    for i in range(n):
+        counter.run(integrator.update, LongInt(start + (i + 1) * TICK_NS), VolumeIntegrator.flow_ul(flows[i]))
+    results.append(("fixed-point", counter))
+
+    # and a tick where the flow has changed pays for the conversion too
+    def update(timestamp, flow):
+        integrator.update(timestamp, VolumeIntegrator.flow_ul(flow))
+
+    counter = AllocationCounter((update.__code__,), boxed_floats)
+    for i in range(n):
+        counter.run(update, LongInt(start + (n + i + 1) * TICK_NS), Float(flows[i]))
+    results.append(("+ flow_ul", counter))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the volume integrator.")
+    parser.add_argument("--hours", type=float, default=1)
+    parser.add_argument("--updates", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for name, ns in speed(args.updates):
+        print("{:12} {:7.1f} ns/update on CPython".format(name, ns))
+
+    boxed = allocations(ALLOCATION_UPDATES, True)
+    immediate = allocations(ALLOCATION_UPDATES, False)
+    print("{:12} {:>13} {:>17} {:>12}".format("per update", "boxed floats", "immediate floats", "bytecodes"))
+    for (name, b), (_, i) in zip(boxed, immediate):
+        print("{:12} {:>13.1f} {:>17.1f} {:>12.1f}".format(
+            name, b.total() / ALLOCATION_UPDATES, i.total() / ALLOCATION_UPDATES, b.opcodes / ALLOCATION_UPDATES))
+
+    exact, fixed, doubles, singles = accuracy(args.hours, args.seed)
+    print("{:.1f}h of 1ms +/-0.2ms ticks, exact volume {:.6f} L".format(args.hours, exact))
+    for name, vol in (("fixed-point", fixed), ("float64", doubles), ("float32", singles)):
+        print("{:12} {:.6f} L, error {:+.3f} mL".format(name, vol, (vol - exact) * 1000))
+
+
+if __name__ == "__main__":
+    main()
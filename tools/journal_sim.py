@@ -0,0 +1,112 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import argparse
+import os
+import random
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from journal import Journal  # noqa: E402
+
+# Host-side simulation of NVM wear over a shift. Two stations pour random volumes at a fixed flow rate with idle gaps
+# in between, and the state is offered for saving every STATE_FREQ, exactly as on the board. Writes are counted per
+# erase block for the old fixed-offset scheme and for the journal.
+
+STATE_FREQ = 2  # secs
+FLOW_RATE = 10 / 60  # litres/sec
+
+
+class CountingNVM:
+
+    def __init__(self, size, block_size):
+        self._data = bytearray(b"\xff" * size)
+        self.block_size = block_size
+        self.block_writes = [0] * ((size + block_size - 1) // block_size)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        for block in range(key.start // self.block_size, (key.stop - 1) // self.block_size + 1):
+            self.block_writes[block] += 1
+
+
+def simulate(hours, nvm_size, block_size, threshold, seed):
+    rng = random.Random(seed)
+    fixed = CountingNVM(nvm_size, block_size)
+    journalled = CountingNVM(nvm_size, block_size)
+    journal = Journal(journalled, "ff", threshold)
+    journal.load()
+
+    volumes = [0.0, 0.0]
+    idle = [rng.uniform(30, 300), rng.uniform(30, 300)]
+    for _ in range(int(hours * 3600 / STATE_FREQ)):
+        for i in range(2):
+            if volumes[i] > 0:
+                volumes[i] = max(0.0, volumes[i] - FLOW_RATE * STATE_FREQ)
+            else:
+                idle[i] -= STATE_FREQ
+                if idle[i] <= 0:
+                    volumes[i] = rng.uniform(0.2, 2.0)
+                    idle[i] = rng.uniform(30, 300)
+        fixed[0:8] = struct.pack("ff", volumes[0], volumes[1])
+        journal.save(volumes)
+
+    # A reboot must find the newest record
+    reloaded = Journal(journalled, "ff", threshold).load()
+    assert reloaded == struct.unpack("<ff", struct.pack("<ff", *volumes)), reloaded
+
+    # Pours that end less than the threshold from empty must still be saved as empty
+    journal.save((threshold / 2, threshold / 2))
+    journal.save((0.0, 0.0))
+    reloaded = Journal(journalled, "ff", threshold).load()
+    assert reloaded == (0.0, 0.0), reloaded
+    return fixed, journalled, journal
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate NVM wear from persisting controller state.")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--nvm-size", type=int, default=256)
+    parser.add_argument("--block-size", type=int, default=64)
+    parser.add_argument("--threshold", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    fixed, journalled, journal = simulate(args.hours, args.nvm_size, args.block_size, args.threshold, args.seed)
+    print("{:.0f}h shift, {} byte NVM, {} byte erase blocks".format(args.hours, args.nvm_size, args.block_size))
+    print("fixed offset: {} writes, per block {}".format(sum(fixed.block_writes), fixed.block_writes))
+    print("journal:      {} writes ({} slots of {} bytes), per block {}".format(
+        journal.writes, journal.slots, journal.record_size, journalled.block_writes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import standin  # noqa: E402
+
+standin.install()
+
+from replay_sensor import ReplaySensor  # noqa: E402
+from filters import SGFilter, EMAFilter, MedianFilter, PassThroughFilter  # noqa: E402
+
+# Replays a capture through the Sensor filtering as fast as possible and summarises the filtered flow and
+# temperature, optionally writing them out as CSV (capture time in secs, flow, temperature) for plotting. Each
+# channel's filter can be swapped to compare their delay against how rough the filtered flow is.
+
+
+# sg:<nl>:<nr>[:<m>], ema:<alpha>, median:<window> or raw
+def parse_filter(spec):
+    name, *params = spec.split(":")
+    try:
+        if name == "sg" and len(params) in (2, 3):
+            return SGFilter(*(int(p) for p in params))
+        if name == "ema" and len(params) == 1:
+            return EMAFilter(float(params[0]))
+        if name == "median" and len(params) == 1:
+            return MedianFilter(int(params[0]))
+        if name == "raw" and not params:
+            return PassThroughFilter()
+    except ValueError as ex:
+        raise argparse.ArgumentTypeError("{}: {}".format(spec, ex))
+    raise argparse.ArgumentTypeError("unknown filter {}".format(spec))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a raw receiver capture through the sensor filtering.")
+    parser.add_argument("path")
+    parser.add_argument("--flow-ch", type=int, default=0)
+    parser.add_argument("--temp-ch", type=int, default=1)
+    parser.add_argument("--flow-filter", type=parse_filter, help="sg:<nl>:<nr>[:<m>], ema:<alpha>, median:<n> or raw")
+    parser.add_argument("--temp-filter", type=parse_filter, help="as --flow-filter")
+    parser.add_argument("--csv", help="write the filtered values to this file")
+    args = parser.parse_args()
+
+    sensor = ReplaySensor(args.path, args.flow_ch, args.temp_ch, flow_filter=args.flow_filter,
+                          temp_filter=args.temp_filter)
+    out = open(args.csv, "w") if args.csv else None
+    records = 0
+    flowing = 0
+    flow_max = 0.0
+    flow_prev = 0.0
+    roughness = 0.0  # sum of the changes in filtered flow between records while flowing
+    temp_min = temp_max = None
+    started = time.perf_counter()
+    while sensor.step():
+        records += 1
+        flow = sensor.flow_rate
+        temp = sensor.temperature
+        if flow > 0:
+            flowing += 1
+            if flow > flow_max:
+                flow_max = flow
+            if flow_prev > 0:
+                roughness += abs(flow - flow_prev)
+        flow_prev = flow
+        if temp_min is None or temp < temp_min:
+            temp_min = temp
+        if temp_max is None or temp > temp_max:
+            temp_max = temp
+        if out:
+            out.write("{:.6f},{:.3f},{:.3f}\n".format(sensor.position / 1000000, flow, temp))
+    wall = time.perf_counter() - started
+    secs = sensor.position / 1000000
+    sensor.close()
+    if out:
+        out.close()
+
+    print("{} records, {:.0f} captured secs replayed in {:.2f} wall secs ({:.0f}x)".format(
+        records, secs, wall, secs / wall if wall else 0))
+    for channel, f in (("flow", sensor.flow_filter), ("temperature", sensor.temp_filter)):
+        print("{} filter: {} delay {:g} samples, cost {} per sample".format(channel, type(f).__name__, f.delay, f.cost))
+    print("flow: {} records flowing, max {:.2f} L/min, mean change {:.4f} L/min per record".format(
+        flowing, flow_max, roughness / flowing if flowing else 0))
+    print("temperature: {:.2f} to {:.2f} C".format(temp_min or 0, temp_max or 0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import argparse
+import contextlib
+import os
+import random
+import runpy
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import standin  # noqa: E402
+
+# Runs code.py on desktop CPython against the stand-in hardware, on a virtual clock, for a number of simulated hours.
+# An operator dials a random volume into each station's encoder and presses the button to pour it, then waits a
+# random idle gap. At the end the bus load and each pour's error against the volume actually delivered are reported.
+
+STEP = 0.25  # litres per encoder detent
+CLICK_DELAY_NS = 500000000
+TREND_POURS = 10  # the most recent pours, whose mean error shows where the shut-off has settled
+
+
+class Operator:
+
+    def __init__(self, world, rng, max_litres, min_idle, max_idle):
+        self._world = world
+        self._rng = rng
+        self._max_steps = int(max_litres / STEP)
+        self._min_idle = min_idle
+        self._max_idle = max_idle
+        self.pours = []  # (station, target litres, litres delivered before the pour)
+
+    def start(self, station, encoder):
+        self._schedule(station, encoder, self._world.clock.monotonic_ns())
+
+    # Litres delivered by each pour, which ends where the next one on the same station starts
+    def finish(self):
+        timestamp = self._world.clock.monotonic_ns()
+        result = []
+        for i, (station, target, before) in enumerate(self.pours):
+            after = station.litres(timestamp)
+            for other, _, start in self.pours[i + 1:]:
+                if other is station:
+                    after = start
+                    break
+            result.append((station, target, after - before))
+        return result
+
+    def _schedule(self, station, encoder, timestamp):
+        idle = self._rng.uniform(self._min_idle, self._max_idle)
+        self._world.clock.at(timestamp + int(idle * 1000000000), lambda ts: self._dial(station, encoder, ts))
+
+    def _dial(self, station, encoder, timestamp):
+        steps = self._rng.randint(1, self._max_steps)
+        encoder.rotate(steps)
+        self.pours.append((station, steps * STEP, station.litres(timestamp)))
+        self._world.clock.at(timestamp + CLICK_DELAY_NS, lambda ts: self._press(station, encoder, steps, ts))
+
+    def _press(self, station, encoder, steps, timestamp):
+        encoder.click()
+        pour_ns = int(steps * STEP / station.flow_rate * 60 * 1000000000)
+        self._schedule(station, encoder, timestamp + pour_ns)
+
+
+def simulate(hours, seed, max_litres, min_idle, max_idle, quiet, capture=None, telemetry=None):
+    world = standin.default_world(seed=seed)
+    if capture or telemetry:
+        world.usb_data = open(capture or telemetry, "wb")
+    standin.install(world)
+    if capture or telemetry:
+        import app
+        app.CAPTURE = bool(capture)
+        app.TELEMETRY = bool(telemetry)
+    world.clock.end_ns = int(hours * 3600 * 1000000000)
+    operator = Operator(world, random.Random(seed), max_litres, min_idle, max_idle)
+    for station, address in zip(world.stations, (0x78, 0x70)):
+        operator.start(station, world.devices[address])
+
+    started = time.perf_counter()
+    with open(os.devnull, "w") if quiet else contextlib.nullcontext(sys.stdout) as out:
+        with contextlib.redirect_stdout(out):
+            try:
+                runpy.run_path(os.path.join(ROOT, "code.py"), run_name="__main__")
+            except standin.SimulationEnd:
+                pass
+    if capture or telemetry:
+        world.usb_data.close()
+    return world, operator, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run code.py against the stand-in hardware on a virtual clock.")
+    parser.add_argument("--hours", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-litres", type=float, default=2.0)
+    parser.add_argument("--min-idle", type=float, default=30, help="secs")
+    parser.add_argument("--max-idle", type=float, default=300, help="secs")
+    parser.add_argument("--quiet", action="store_true", help="discard the dispenser's own output")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--capture", help="also capture the raw receiver codes to this file")
+    group.add_argument("--telemetry", help="also record the telemetry frames to this file")
+    args = parser.parse_args()
+
+    world, operator, wall = simulate(args.hours, args.seed, args.max_litres, args.min_idle, args.max_idle, args.quiet,
+                                     args.capture, args.telemetry)
+    secs = world.clock.monotonic_ns() / 1000000000
+    print("{:.0f} simulated secs in {:.1f} wall secs ({:.0f}x)".format(secs, wall, secs / wall))
+    for i2c in world.buses:
+        print("i2c {}Hz: {} transactions ({:.1f}/s), {} bytes, {:.1f}% busy, by address {}".format(
+            i2c.frequency, i2c.transactions, i2c.transactions / secs, i2c.bytes, 100 * i2c.busy_ns / (secs * 1e9),
+            {hex(k): v for k, v in sorted(i2c.by_address.items())}))
+    for uart in world.uarts:
+        print("uart {} baud: {} writes, {} bytes ({:.1f}/s), {:.2f}% busy, {} panel commands".format(
+            uart.baudrate, uart.writes, uart.bytes, uart.bytes / secs, 100 * uart.busy_ns / (secs * 1e9),
+            uart.panel.commands))
+        print("panel: {}".format(uart.panel.attributes))
+    pours = operator.finish()
+    for station, target, poured in pours:
+        print("{}: target {:.2f} L poured {:.3f} L error {:+.3f} L".format(station.valve_pin, target, poured,
+                                                                           poured - target))
+    errors = [poured - target for station, target, poured in pours]
+    if errors:
+        last = errors[-TREND_POURS:]
+        print("{} pours: mean error {:+.4f} L, last {} {:+.4f} L".format(
+            len(errors), sum(errors) / len(errors), len(last), sum(last) / len(last)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import standin  # noqa: E402
+
+standin.install()
+
+import busio  # noqa: E402
+from board import SCL, SDA, TX, RX  # noqa: E402
+
+import app  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+
+# Control latency against the number of stations, on the stand-in hardware.
+#
+# For each N a station table is generated (encoders from 0x70, one receiver per two stations from 0x68) and the app's
+# tasks run on the deadline scheduler for a stretch of simulated time. The virtual clock only moves for bus and UART
+# transfers, so a controller's lateness against its deadline is exactly the time it spent queued behind I/O. Each N is
+# run with the tasks staggered across their periods as app.py does, and with every offset forced to zero. The
+# receivers' lateness is reported too, as the delay to flow sampling. Rows where the bus and display UART are busy
+# together for more than SATURATED of the time are marked: the controllers then queue behind I/O whatever the offsets.
+
+RECEIVER = 0x68
+ENCODER = 0x70
+WARM_UP_NS = 1000000000
+PRESS_NS = 2000000000
+UART_BAUDRATE = 115200
+UART_BITS_PER_BYTE = 10
+SATURATED = 0.9  # I2C and UART busy together, past which the controllers are always queued behind I/O
+
+
+def station_table(n):
+    stations = []
+    world_stations = []
+    for i in range(n):
+        pin = "D{}".format(i + 2)
+        receiver = RECEIVER + i // 2
+        flow_ch = 2 * (i % 2)
+        stations.append(("s{}".format(i), ENCODER + i, pin, ("p{}".format(i), "vol{}".format(i), "flow{}".format(i),
+                         "tmp{}".format(i)), (receiver, flow_ch, flow_ch + 1)))
+        world_stations.append((ENCODER + i, pin, receiver, flow_ch, flow_ch + 1))
+    return stations, world_stations
+
+
+def run(n, sim_secs, frequency, stagger):
+    stations, world_stations = station_table(n)
+    world = standin.install(standin.default_world(seed=1, stations=world_stations))
+    i2c = busio.I2C(SCL, SDA, frequency=frequency)
+    uart = busio.UART(TX, RX, baudrate=UART_BAUDRATE)
+    with open(os.devnull, "w") as out, contextlib.redirect_stdout(out):
+        dispenser = app.App(i2c, uart, stations)
+
+    # Dial in the most every station can pour, then have everyone press their button together every PRESS_NS,
+    # opening and closing all the valves at once. Each press changes every encoder's LED.
+    encoders = [world.devices[ENCODER + i] for i in range(n)]
+    for enc in encoders:
+        enc.rotate(int(app.Encoder.MAX_VALUE / app.Encoder.STEP))
+
+    def press(timestamp):
+        for enc in encoders:
+            enc.click()
+        world.clock.at(timestamp + PRESS_NS, press)
+
+    clock = world.clock
+    clock.after(WARM_UP_NS // 2, press)
+    start = clock.monotonic_ns()
+    busy = i2c.busy_ns
+    scheduler = Scheduler()
+    controllers = []
+    receivers = []
+    wall = [0]
+
+    def timed(callback):
+        def tick(timestamp):
+            t = time.perf_counter_ns()
+            callback(timestamp)
+            wall[0] += time.perf_counter_ns() - t
+        return tick
+
+    for name, callback, period, priority, offset in dispenser.tasks():
+        is_controller = name.endswith(" controller")
+        task = scheduler.add(name, timed(callback) if is_controller else callback, period, priority,
+                             start + (offset if stagger else 0))
+        if is_controller:
+            controllers.append(task)
+        elif name.startswith("adc "):
+            receivers.append(task)
+    # Start measuring once the start-up burst of panel and encoder set-up has gone out
+    warm = start + WARM_UP_NS
+    while clock.monotonic_ns() < warm:
+        scheduler.run_next()
+    for task in controllers + receivers:
+        task.runs = task.missed = task.max_jitter = task.total_jitter = 0
+    wall[0] = 0
+    start = clock.monotonic_ns()
+    busy = i2c.busy_ns
+    sent = uart.bytes
+
+    end = start + int(sim_secs * 1000000000)
+    while clock.monotonic_ns() < end:
+        scheduler.run_next()
+
+    secs = (clock.monotonic_ns() - start) / 1000000000
+    runs = sum(task.runs for task in controllers)
+    return {
+        "mean_us": sum(task.total_jitter for task in controllers) / runs / 1000,
+        "max_us": max(task.max_jitter for task in controllers) / 1000,
+        "missed": sum(task.missed for task in controllers),
+        "adc_max_us": max(task.max_jitter for task in receivers) / 1000,
+        "wall_ns": wall[0] // runs,
+        "bus": (i2c.busy_ns - busy) / (secs * 1000000000),
+        "uart": (uart.bytes - sent) * UART_BITS_PER_BYTE / (secs * UART_BAUDRATE),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark control latency against the number of stations.")
+    parser.add_argument("--stations", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--sim-secs", type=float, default=10)
+    parser.add_argument("--frequency", type=int, default=100000, help="I2C bus frequency (Hz)")
+    args = parser.parse_args()
+
+    print("{:>3} {:>9} {:>11} {:>10} {:>8} {:>12} {:>14} {:>9} {:>10}".format(
+        "N", "staggered", "mean (us)", "max (us)", "missed", "tick (ns)", "adc max (us)", "i2c busy", "uart busy"))
+    saturated = []
+    for n in args.stations:
+        for stagger in (True, False):
+            result = run(n, args.sim_secs, args.frequency, stagger)
+            load = result["bus"] + result["uart"]
+            print("{:>3} {:>9} {:>11.0f} {:>10.0f} {:>8} {:>12} {:>14.0f} {:>8.0f}% {:>9.0f}%{}".format(
+                n, "yes" if stagger else "no", result["mean_us"], result["max_us"], result["missed"],
+                result["wall_ns"], result["adc_max_us"], 100 * result["bus"], 100 * result["uart"],
+                "  saturated" if load >= SATURATED else ""))
+            if load >= SATURATED and n not in saturated:
+                saturated.append(n)
+
+    # The I2C and UART writes block, so once they fill the time between ticks no offsets can keep the controllers
+    # on time
+    for n in saturated:
+        print("N={}: blocking I2C and UART transfers take {:.0f}% or more of the time, so controller lateness is not "
+              "bounded at {} Hz".format(n, 100 * SATURATED, args.frequency))
+
+if __name__ == "__main__":
+    main()
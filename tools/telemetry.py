@@ -0,0 +1,179 @@
+# coding=iso-8859-1
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2020 Tom Greasley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import argparse
+import os
+import struct
+import sys
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from telemetry import Telemetry  # noqa: E402
+
+# Decodes a telemetry stream (see telemetry.py) into one array per field, for analysis on the desktop. The stream is
+# read in chunks from a file or, with pyserial, straight from the board's data port. Timestamps are unwrapped to
+# 64-bit us. Frames are located by their sync bytes, so a stream joined part way through or with a corrupt stretch
+# loses only the frames it cuts.
+
+FIELDS = (
+    ("timestamp", 'Q'),
+    ("station", 'B'),
+    ("flags", 'B'),
+    ("events", 'B'),
+    ("raw_flow", 'h'),
+    ("flow", 'f'),
+    ("temperature", 'f'),
+    ("microlitres", 'l'),
+)
+
+EVENTS = (
+    (0x01, "volume"),
+    (0x02, "button"),
+    (0x04, "start"),
+    (0x08, "stop"),
+    (0x10, "done"),
+    (0x20, "reset"),
+    (0x40, "settled"),
+)
+
+WRAP_US = 1 << 32
+
+
+class Frames:
+
+    def __init__(self):
+        self.skipped = 0  # bytes discarded whilst looking for a frame boundary
+        self._last_us = None
+        for name, typecode in FIELDS:
+            setattr(self, name, array(typecode))
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def append(self, values):
+        us = values[1]
+        if self._last_us is not None:
+            us += self._last_us - self._last_us % WRAP_US
+            if us < self._last_us:
+                us += WRAP_US
+        self._last_us = us
+        self.timestamp.append(us)
+        for (name, _), value in zip(FIELDS[1:], values[2:]):
+            getattr(self, name).append(value)
+
+
+def decode(chunks, frames=None):
+    frames = frames if frames is not None else Frames()
+    size = Telemetry.FRAME_SIZE
+    pending = bytearray()
+    synced = False
+    for chunk in chunks:
+        pending += chunk
+        i = 0
+        while i + size <= len(pending):
+            if pending[i] == Telemetry.SYNC:
+                if synced:
+                    frames.append(struct.unpack_from(Telemetry.FRAME, pending, i))
+                    i += size
+                    continue
+                # Only trust a boundary once the next frame's sync byte is seen too
+                if i + size < len(pending):
+                    if pending[i + size] == Telemetry.SYNC:
+                        synced = True
+                        continue
+                else:
+                    break
+            synced = False
+            frames.skipped += 1
+            i += 1
+        del pending[:i]
+    return frames
+
+
+def read_chunks(f, size=65536):
+    while True:
+        chunk = f.read(size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def read_frames(path):
+    with open(path, "rb") as f:
+        return decode(read_chunks(f))
+
+
+def event_names(events):
+    return [name for bit, name in EVENTS if events & bit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode a telemetry stream from a file or the board's data port.")
+    parser.add_argument("path", help="a recorded stream, or the data port with --serial")
+    parser.add_argument("--serial", action="store_true", help="read from a serial port until interrupted")
+    parser.add_argument("--events", action="store_true", help="list the controller events")
+    parser.add_argument("--csv", help="write every frame to this file")
+    args = parser.parse_args()
+
+    if args.serial:
+        try:
+            import serial
+        except ImportError:
+            raise SystemExit("Reading the data port needs pyserial (pip install pyserial).")
+        frames = Frames()
+        with serial.Serial(args.path, timeout=1) as port:
+            try:
+                decode(read_chunks(port, 4096), frames)
+            except KeyboardInterrupt:
+                pass
+    else:
+        frames = read_frames(args.path)
+
+    secs = (frames.timestamp[-1] - frames.timestamp[0]) / 1000000 if len(frames) else 0
+    print("{} frames over {:.0f} secs, {} bytes skipped".format(len(frames), secs, frames.skipped))
+    for station in sorted(set(frames.station)):
+        rows = [i for i in range(len(frames)) if frames.station[i] == station]
+        open_rows = [i for i in rows if frames.flags[i] & Telemetry.FLAG_OPEN]
+        flows = [frames.flow[i] for i in open_rows]
+        print("station {}: {} frames, open in {}, mean flow while open {:.2f} L/min, temperature {:.2f} C".format(
+            station, len(rows), len(open_rows), sum(flows) / len(flows) if flows else 0,
+            sum(frames.temperature[i] for i in rows) / len(rows)))
+
+    if args.events:
+        for i in range(len(frames)):
+            if frames.events[i]:
+                print("{:12.3f} station {}: {} ({} uL left)".format(
+                    frames.timestamp[i] / 1000000, frames.station[i], " ".join(event_names(frames.events[i])),
+                    frames.microlitres[i]))
+
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write(",".join(name for name, _ in FIELDS) + "\n")
+            for i in range(len(frames)):
+                f.write(",".join(str(getattr(frames, name)[i]) for name, _ in FIELDS) + "\n")
+
+
+if __name__ == "__main__":
+    main()